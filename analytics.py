@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from price_matrix import to_matrix, pack_rows, unpack_rows, rolling_mean
+from dividend_yield import dividend_yields, average_dividend_yield, trailing_dividend_yield
+from bollinger import bollinger_bands, latest_signal
+
+def linear_trend(packed, counts):
+    # Least-squares line through each row against its observation number, all rows at once
+    n = counts.astype(np.float64)
+    x = np.arange(packed.shape[1], dtype=np.float64)
+    valid = x < n[:, None]
+    y = np.where(valid, packed, 0.0)
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    sum_y = y.sum(axis=1)
+    sum_xy = (y * x).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+        intercept = (sum_y - slope * sum_x) / n
+    return slope, intercept
+
+def cross_masks(short_ma, long_ma):
+    # Golden/death crosses along each packed row, comparing with the previous observation
+    previous_short = np.full(short_ma.shape, np.nan)
+    previous_long = np.full(long_ma.shape, np.nan)
+    previous_short[:, 1:] = short_ma[:, :-1]
+    previous_long[:, 1:] = long_ma[:, :-1]
+    golden = (short_ma > long_ma) & (previous_short <= previous_long)
+    death = (short_ma < long_ma) & (previous_short >= previous_long)
+    return golden, death
+
+def compute_analytics(market_data, years_back=5, short_window=50, long_window=200,
+                      bollinger_window=20, bollinger_k=2.0):
+    close = market_data['Close']
+    tickers = close.columns
+    packed, order, counts = pack_rows(to_matrix(close))
+    rows = np.arange(len(tickers))
+
+    def frame(packed_values):
+        return pd.DataFrame(unpack_rows(packed_values, order, counts).T, index=close.index, columns=tickers)
+
+    slope, intercept = linear_trend(packed, counts)
+    trend = intercept[:, None] + slope[:, None] * np.arange(packed.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        start_price = intercept
+        end_price = intercept + slope * (counts - 1)
+        cagr = ((end_price / start_price) ** (1 / years_back) - 1) * 100
+
+    # The charts plot every bar's moving averages, which the running windows in
+    # indicators.py don't keep, so the full series are computed here in one vectorised
+    # pass. The daily golden cross flag and the bar stream alerts use those windows
+    short_ma = rolling_mean(packed, counts, short_window)
+    long_ma = rolling_mean(packed, counts, long_window)
+    golden, death = cross_masks(short_ma, long_ma)
+
+    yields = dividend_yields(market_data)
+    trailing_yields = trailing_dividend_yield(market_data)
+    bands = bollinger_bands(close, window=bollinger_window, k=bollinger_k)
+
+    last = np.maximum(counts - 1, 0)
+    summary = pd.DataFrame({
+        'closing_price': np.where(counts > 0, packed[rows, last], np.nan),
+        'cagr': cagr,
+        'average_yield': average_dividend_yield(yields, tickers).to_numpy(),
+        'trailing_yield': trailing_yields.ffill().iloc[-1].fillna(0).to_numpy() if len(close) else 0.0,
+        'bollinger_signal': [latest_signal(bands, ticker) for ticker in tickers],
+    }, index=tickers)
+
+    return {
+        'close': close,
+        'trend': frame(trend),
+        'short_ma': frame(short_ma),
+        'long_ma': frame(long_ma),
+        'golden_cross': frame(golden.astype(np.float64)) == 1,
+        'death_cross': frame(death.astype(np.float64)) == 1,
+        'bands': bands,
+        'summary': summary,
+    }
+
+def ticker_view(analytics, ticker):
+    # One ticker's series on its own trading calendar, ready for plotting
+    dates = analytics['close'][ticker].dropna().index
+    view = pd.DataFrame({
+        'Close': analytics['close'][ticker],
+        'Trend': analytics['trend'][ticker],
+        'Short_MA': analytics['short_ma'][ticker],
+        'Long_MA': analytics['long_ma'][ticker],
+        'Golden_Cross': analytics['golden_cross'][ticker],
+        'Death_Cross': analytics['death_cross'][ticker],
+        'Upper_Band': analytics['bands']['upper'][ticker],
+        'Lower_Band': analytics['bands']['lower'][ticker],
+    })
+    return view.loc[dates]
@@ -0,0 +1,162 @@
+import argparse
+import importlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import registry
+
+# Runs each report module in its own process against recorded fixtures and reports
+# wall time, CPU time, peak RSS and a per-stage breakdown.
+#
+#   python benchmark.py --mode record   # capture fixtures from the live sites once
+#   python benchmark.py                 # replay them offline
+#   python benchmark.py stock fuel --repeat 2
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmark name: (module, function producing the report HTML); stock runs its whole pipeline
+modules = {**registry.available, 'stock': ('stock', None)}
+
+# Functions timed as each stage, as (stage, module, attribute). Modules that import a
+# function by name are listed themselves, since patching the source module misses them
+stage_hooks = [
+    ('fetch', 'http_client', 'request'),
+    ('fetch', 'yfinance', 'download'),
+    ('parse', 'feedparser', 'parse'),
+    ('parse', 'ebay', 'parse'),
+    ('parse', 'steam_wishlist', 'parse'),
+    ('parse', 'huggingface', 'parse'),
+    ('parse', 'tcbscans', 'parse'),
+    ('analyze', 'stock', 'compute_analytics'),
+    ('render', 'stock', 'render_report'),
+    ('send', 'stock', 'send_email_with_attachment'),
+    ('send', 'send_email', 'send_email_with_attachment'),
+]
+
+stages = ['import', 'fetch', 'parse', 'analyze', 'render', 'send']
+
+def timed(stage, func, totals):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[stage] = totals.get(stage, 0.0) + time.perf_counter() - start
+    return wrapper
+
+def install_hooks(totals):
+    for stage, module_name, attribute in stage_hooks:
+        module = sys.modules.get(module_name)
+        if module is not None and hasattr(module, attribute):
+            setattr(module, attribute, timed(stage, getattr(module, attribute), totals))
+
+def run_child(name, mode, fixtures):
+    # Runs inside the benchmark's scratch directory, in a fresh interpreter
+    sys.path.insert(0, repo_dir)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    totals = {}
+
+    import replay
+    replay.enable(mode, fixtures)
+    import smtp_sink
+    import send_email
+    sink = smtp_sink.start_sink()
+    send_email.smtp_host, send_email.smtp_port, send_email.smtp_starttls = '127.0.0.1', sink.port, False
+
+    module_name, function_name = modules[name]
+    import_start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    totals['import'] = time.perf_counter() - import_start
+    install_hooks(totals)
+
+    error = None
+    try:
+        if name == 'stock':
+            save_paths, email_details = module.fetch_and_visualize(module.tickers, years_back=module.years_back, y_min=module.y_min)
+            body = module.format_email_body(email_details, save_paths)
+            module.send_email_with_attachment(module.report_subject(), 'bench@localhost', 'bench@localhost', '', body,
+                                              inline_images=module.report_images(save_paths, email_details))
+        else:
+            body = getattr(module, function_name)()
+            send_email.send_email_with_attachment(f"Benchmark {name}", 'bench@localhost', 'bench@localhost', '', body)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        'module': name,
+        'wall': time.perf_counter() - wall_start,
+        'cpu': time.process_time() - cpu_start,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'stages': totals,
+        'email_bytes': sum(len(message['data']) for message in sink.messages),
+        'error': error,
+    }
+
+def settings_source():
+    for file_name in ('settings.toml', 'settings_example.toml'):
+        path = os.path.join(repo_dir, file_name)
+        if os.path.exists(path):
+            return path
+
+def run_benchmarks(names, mode, fixtures, repeat):
+    results = []
+    for name in names:
+        # Each module gets its own scratch directory, so caches and state start cold
+        # and the repeat runs show the warm behaviour
+        work_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+        shutil.copy(settings_source(), os.path.join(work_dir, 'settings.toml'))
+        try:
+            for run in range(repeat):
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', name, '--mode', mode, '--fixtures', fixtures],
+                    cwd=work_dir, capture_output=True, text=True)
+                lines = process.stdout.strip().splitlines()
+                try:
+                    result = json.loads(lines[-1])
+                except (IndexError, json.JSONDecodeError):
+                    result = {'module': name, 'error': process.stderr.strip().splitlines()[-1:] or 'no output', 'stages': {}}
+                result['run'] = run + 1
+                results.append(result)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def print_table(results):
+    header = f"{'module':<12}{'run':>4}{'wall s':>9}{'cpu s':>8}{'rss MB':>8}" + "".join(f"{stage:>9}" for stage in stages)
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        if 'wall' not in result:
+            print(f"{result['module']:<12}{result['run']:>4}  failed: {result['error']}")
+            continue
+        row = f"{result['module']:<12}{result['run']:>4}{result['wall']:>9.2f}{result['cpu']:>8.2f}{result['peak_rss_mb']:>8.0f}"
+        row += "".join(f"{result['stages'].get(stage, 0.0):>9.3f}" for stage in stages)
+        if result['error']:
+            row += f"  ({result['error']})"
+        print(row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark report modules offline against recorded fixtures")
+    parser.add_argument('modules', nargs='*', help=f"Modules to run (default all): {', '.join(modules)}")
+    parser.add_argument('--mode', default='replay', choices=['replay', 'record', 'live'])
+    parser.add_argument('--fixtures', default=os.path.join(repo_dir, 'fixtures'))
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per module in the same scratch directory")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.mode, os.path.abspath(args.fixtures))))
+        sys.exit(0)
+
+    results = run_benchmarks(args.modules or list(modules), args.mode, os.path.abspath(args.fixtures), args.repeat)
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,43 @@
+import pandas as pd
+from price_matrix import to_matrix, pack_rows, unpack_rows, rolling_mean_std
+
+def bollinger_bands(close, window=20, k=2.0, squeeze_lookback=120):
+    # Bands for every ticker of a dates x tickers close frame in one pass
+    packed, order, counts = pack_rows(to_matrix(close))
+    middle, std = rolling_mean_std(packed, counts, window)
+    upper = middle + k * std
+    lower = middle - k * std
+    bandwidth = (upper - lower) / middle
+
+    # A squeeze is the narrowest bandwidth seen over the lookback window
+    lowest = pd.DataFrame(bandwidth.T).rolling(squeeze_lookback, min_periods=squeeze_lookback).min().to_numpy().T
+
+    def frame(packed_values):
+        return pd.DataFrame(unpack_rows(packed_values, order, counts).T, index=close.index, columns=close.columns)
+
+    bands = {
+        'middle': frame(middle),
+        'upper': frame(upper),
+        'lower': frame(lower),
+        'bandwidth': frame(bandwidth),
+    }
+    lowest = frame(lowest)
+    bands['touch_upper'] = close >= bands['upper']
+    bands['touch_lower'] = close <= bands['lower']
+    bands['squeeze'] = bands['bandwidth'] <= lowest
+    return bands
+
+def latest_signal(bands, ticker):
+    # Text summary of the most recent Bollinger signal for the email
+    valid = bands['bandwidth'][ticker].dropna()
+    if valid.empty:
+        return 'N/A'
+    date = valid.index[-1]
+    signals = []
+    if bands['touch_upper'].at[date, ticker]:
+        signals.append('Upper Band Touch')
+    if bands['touch_lower'].at[date, ticker]:
+        signals.append('Lower Band Touch')
+    if bands['squeeze'].at[date, ticker]:
+        signals.append('Squeeze')
+    return ', '.join(signals) if signals else 'None'
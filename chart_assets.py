@@ -0,0 +1,69 @@
+import io
+import os
+import re
+import time
+from PIL import Image
+
+# Charts are mostly flat colour, so a small palette and an optimised PNG (or lossless
+# WebP) shrink them several times over. The DPI is only lowered when no palette can
+# bring an image under its byte budget
+dpi_steps = [100, 85, 72, 60, 50]
+palette_sizes = [64, 32, 16]
+
+# Files the renderer writes: a YYYYmmdd_HHMMSS prefix, then the page or thumbnail suffix
+chart_file_pattern = re.compile(r'^\d{8}_\d{6}[\w.-]*\.(png|webp)$')
+
+def encode_image(image, image_format, colors):
+    quantized = image.quantize(colors=colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        quantized.convert('RGB').save(buffer, 'WEBP', lossless=True, method=6)
+    else:
+        quantized.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+def encode_figure(fig, byte_budget, image_format='png', max_dpi=100):
+    # The best-looking encoding that fits the budget, or the smallest one tried
+    smallest = None
+    for dpi in [dpi for dpi in dpi_steps if dpi <= max_dpi] or [max_dpi]:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi)
+        image = Image.open(buffer).convert('RGB')
+        for colors in palette_sizes:
+            data = encode_image(image, image_format, colors)
+            if smallest is None or len(data) < len(smallest):
+                smallest = data
+            if len(data) <= byte_budget:
+                return data
+    return smallest
+
+def save_figure(fig, path, byte_budget, image_format='png', max_dpi=100):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(encode_figure(fig, byte_budget, image_format, max_dpi))
+    os.replace(tmp_path, path)
+    return path
+
+def prune_archive(directory, keep_days=30, max_bytes=None):
+    # Delete charts older than keep_days, then the oldest ones until the charts fit in
+    # max_bytes. Only rendered chart files are counted or removed, never e.g. .gitignore
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if chart_file_pattern.match(name) and os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    removed = []
+    cutoff = time.time() - keep_days * 86400
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if mtime >= cutoff and (max_bytes is None or total <= max_bytes):
+            break
+        os.remove(path)
+        removed.append(path)
+        total -= size
+    return removed
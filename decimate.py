@@ -0,0 +1,70 @@
+import numpy as np
+
+def bucket_ids(length, buckets):
+    # Contiguous, near-equal buckets over the sample positions
+    return (np.arange(length) * buckets) // length
+
+def minmax_indices(values, buckets):
+    # Position of the lowest and highest finite value in every bucket, found with one
+    # lexsort instead of a Python loop over the buckets
+    length = len(values)
+    ids = bucket_ids(length, buckets)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.array([], dtype=np.int64)
+    low = np.where(finite, values, np.inf)
+    high = np.where(finite, values, -np.inf)
+    starts = np.searchsorted(ids, np.arange(buckets))
+    ends = np.append(starts[1:], length) - 1
+    lows = np.lexsort((low, ids))[starts]
+    highs = np.lexsort((high, ids))[ends]
+    keep = np.concatenate([lows[finite[lows]], highs[finite[highs]]])
+    return np.unique(keep)
+
+def lttb_indices(values, threshold):
+    # Largest-triangle-three-buckets: keep the point in each bucket that forms the
+    # largest triangle with the previously kept point and the next bucket's average
+    length = len(values)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+    x = np.arange(length, dtype=np.float64)
+    y = np.nan_to_num(values.astype(np.float64))
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+    kept = [0]
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        previous = kept[-1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        kept.append(start + int(np.argmax(areas)))
+    kept.append(length - 1)
+    return np.unique(kept)
+
+def decimation_indices(series, width_px, preserve=(), envelope=(), method='minmax'):
+    # Sample positions shared by every line of one chart. Buckets follow the pixel
+    # width, envelope series keep each bucket's extremes, and every position in
+    # preserve (e.g. cross markers) is always kept
+    length = len(next(iter(series.values())))
+    buckets = max(int(width_px), 1)
+    if length <= 2 * buckets:
+        return np.arange(length)
+
+    keep = [np.array([0, length - 1])]
+    for name, values in series.items():
+        finite = np.flatnonzero(np.isfinite(values))
+        if len(finite) == 0:
+            continue
+        # First/last drawn point and global extremes of every line survive exactly
+        keep.append(finite[[0, -1]])
+        keep.append(np.array([np.nanargmin(values), np.nanargmax(values)]))
+        if name in envelope:
+            if method == 'lttb':
+                keep.append(lttb_indices(values, 2 * buckets))
+            else:
+                keep.append(minmax_indices(values, buckets))
+    for mask in preserve:
+        keep.append(np.flatnonzero(mask))
+    return np.unique(np.concatenate(keep))
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+def asof_prices(close, dates, columns):
+    # Last known close on or before each date, for every (date, column) pair at once
+    prices = close.ffill().to_numpy(dtype=np.float64)
+    rows = close.index.searchsorted(dates, side='right') - 1
+    result = np.full(len(rows), np.nan)
+    valid = rows >= 0
+    result[valid] = prices[rows[valid], columns[valid]]
+    return result
+
+def dividend_yields(market_data):
+    # One row per dividend across every ticker, with the yield at the as-of close
+    close = market_data['Close']
+    dividends = market_data['Dividends'].reindex(columns=close.columns)
+    amounts = dividends.to_numpy(dtype=np.float64)
+    rows, columns = np.nonzero(np.nan_to_num(amounts) > 0)
+
+    dates = dividends.index[rows]
+    prices = asof_prices(close, dates, columns)
+    yields = pd.DataFrame({
+        'date': dates,
+        'ticker': close.columns[columns],
+        'dividend': amounts[rows, columns],
+        'price': prices,
+    })
+    yields['yield'] = yields['dividend'] / yields['price']
+    return yields.dropna(subset=['yield'])
+
+def average_dividend_yield(yields, tickers):
+    # Mean yield per dividend as a percentage, 0 for tickers that paid nothing
+    return (yields.groupby('ticker')['yield'].mean() * 100).reindex(tickers, fill_value=0)
+
+def annual_dividend_yield(yields, tickers):
+    # Sum of per-dividend yields in each calendar year, years x tickers, as percentages
+    annual = yields.groupby([yields['date'].dt.year, 'ticker'])['yield'].sum() * 100
+    return annual.unstack('ticker').reindex(columns=tickers).fillna(0).rename_axis('year')
+
+def trailing_dividend_yield(market_data):
+    # Trailing-12-month dividends over the latest close, dates x tickers, as percentages
+    close = market_data['Close'].ffill()
+    dividends = market_data['Dividends'].reindex(columns=close.columns).fillna(0)
+    return dividends.rolling('365D').sum() / close * 100
@@ -1,46 +1,81 @@
-import requests
-from bs4 import BeautifulSoup
-
-def scrape_ebay(search_query):
-    # Replace spaces with '+', as eBay uses this format for search queries
-    search_query = search_query.replace(' ', '+')
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+import history
+import settings
+import state_store
+import tracing
+from html_parse import parse
+
+# The eBay item id in a listing link, e.g. https://www.ebay.com.au/itm/123456789012?...
+item_id_pattern = re.compile(r'/itm/(?:[^/?]+/)?(\d+)')
+price_pattern = re.compile(r'\d[\d,.]*')
+
+# eBay puts a "Shop on eBay" placeholder at the top of the results
+placeholder_titles = {'Shop on eBay'}
+
+# [ebay] settings and their defaults
+defaults = {
+    # Each query is a search term, or a table with a term and an optional max_price to
+    # alert on new listings at or below
+    'queries': ["rtx 3090"],
+    # Result pages followed per query and listings per page (eBay accepts 60, 120 or 240)
+    'max_pages': 3,
+    'page_size': 60,
+    # Queries run at once; http_client still spaces requests to eBay
+    'max_workers': 4,
+    # Listings shown per query in the email
+    'display_count': 5,
+    # Listings not seen for this many days are forgotten, and would count as new again
+    'listing_ttl_days': 30,
+}
+
+def options():
+    return settings.options('ebay', defaults)
+
+def watch_queries():
+    return [query if isinstance(query, dict) else {'term': query} for query in options()['queries']]
+
+def scrape_ebay(search_query, page=1):
     # Base URL
     url = f"https://www.ebay.com.au/sch/i.html"
 
-    # Parameters for the GET request
+    # Parameters for the GET request. requests encodes the spaces in the search term
     params = {
         '_from': 'R40',
         '_nkw': search_query,
         '_sacat': '0',
         'LH_BIN': '1',
         'LH_PrefLoc': '1',
-        '_sop': '15'
+        '_sop': '15',
+        '_ipg': options()['page_size'],
+        '_pgn': page
     }
-    
+
     headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36',
     'Accept-Language': 'en-US,en;q=0.9',
     'Accept-Encoding': 'gzip, deflate, br',
     'Referer': 'https://www.ebay.com.au/'
     }
 
     # Send a GET request to eBay
-    response = requests.get(url, params=params, headers=headers)
-    
+    response = http_client.get(url, params=params, headers=headers)
+
     # Check if the request was successful
     if response.status_code != 200:
-        print(f"Failed to retrieve data: {response.status_code}")
-        return []
+        print(f"Failed to retrieve data for {search_query} page {page}: {response.status_code}")
+        return None
 
-    
-    # Parse the HTML content
-    soup = BeautifulSoup(response.content, 'html.parser')
+
+    # Parse only the result items out of the HTML content
+    soup = parse('ebay', response.content)
 
     # Find all items
     items = soup.find_all('li', {'class': 's-item'})
 
     results = []
-    
+
     for item in items:
         title = price = link = None  # Initialize variables to avoid referencing before assignment
         # Extract the title
@@ -67,45 +102,153 @@ def scrape_ebay(search_query):
             })
     return results
 
-def preprocess_results(results):
-    # Remove the first two entries
-    filtered_results = results[2:] if len(results) > 2 else []
+def item_id(link):
+    match = item_id_pattern.search(link)
+    return match.group(1) if match else None
 
-    # Ensure prices are in ascending order and remove entries as soon as they are not
-    if not filtered_results:
-        return filtered_results
-
-    final_results = []
-    # Parse the first price correctly removing the currency symbol and commas
-    last_price = parse_price(filtered_results[0]['price'])
-
-    for item in filtered_results:
-        current_price = parse_price(item['price'])
-
-        if current_price >= last_price:
-            final_results.append(item)
-            last_price = current_price
+def parse_price(price_str):
+    # The lowest amount in strings like "AU $1,299.00", "$80.00 to $120.00" or "1.299,00 EUR",
+    # or None when there isn't one
+    prices = []
+    for number in price_pattern.findall(price_str):
+        number = number.rstrip('.,')
+        # A comma before the last two digits is a decimal comma
+        if re.search(r',\d{2}$', number):
+            number = number.replace('.', '').replace(',', '.')
         else:
-            break
+            number = number.replace(',', '')
+        try:
+            prices.append(float(number))
+        except ValueError:
+            continue
+    return min(prices) if prices else None
 
-    return final_results
-
-def parse_price(price_str):
-    # Remove currency symbols, commas, and convert to float
-    return float(price_str.replace('AU $', '').replace(',', ''))
+def preprocess_results(results):
+    # Listings keyed by item id, without placeholders or unpriced entries. A listing
+    # repeated across pages keeps its first appearance
+    listings = {}
+    for result in results:
+        key = item_id(result['link'])
+        price = parse_price(result['price'])
+        if key is None or price is None or result['title'] in placeholder_titles or key in listings:
+            continue
+        listings[key] = {**result, 'price_value': price}
+    return listings
+
+def search(term):
+    # Follow result pages until max_pages, a failed page, or a page with nothing new.
+    # Returns the listings and whether every page arrived
+    config = options()
+    listings = {}
+    for page in range(1, config['max_pages'] + 1):
+        results = scrape_ebay(term, page)
+        if results is None:
+            return listings, False
+        page_listings = {key: listing for key, listing in preprocess_results(results).items() if key not in listings}
+        listings.update(page_listings)
+        if not page_listings or len(results) < config['page_size']:
+            break
+    return listings, True
+
+def record_prices(search_term, listings):
+    # Every listing's price goes into the history archive under its search term
+    history.record('ebay', [(search_term, listing['price_value']) for listing in listings.values()])
+
+def update_listings(found):
+    # found maps item id to (listing, queries). Listings are stored once however many
+    # queries find them, and only new, repriced or day-old ones are written, so a
+    # listing's record is refreshed daily while it's up. Returns the ids not seen on
+    # any earlier run
+    previous = state_store.get_many('ebay_listings', found)
+    now = time.time()
+    changed = {}
+    for key, (listing, terms) in found.items():
+        old = previous.get(key)
+        if (old is None or old['price'] != listing['price_value'] or not set(terms) <= set(old['queries'])
+                or now - old['updated'] > 86400):
+            changed[key] = {'title': listing['title'], 'link': listing['link'], 'price': listing['price_value'],
+                            'queries': sorted(set(terms) | set(old['queries'] if old else [])),
+                            'first_seen': old['first_seen'] if old else now, 'updated': now}
+    state_store.upsert_records('ebay_listings', changed)
+    return found.keys() - previous.keys()
+
+def prune_listings():
+    # Listings and query price indexes (e.g. for queries since removed from settings)
+    # that haven't been written within listing_ttl_days are dropped
+    listing_ttl_days = options()['listing_ttl_days']
+    cutoff = time.time() - listing_ttl_days * 86400
+    pruned = state_store.delete_stale_records('ebay_listings', cutoff)
+    state_store.delete_stale_records('ebay_index', cutoff)
+    if pruned:
+        print(f"Forgot {pruned} eBay listings not seen for {listing_ttl_days} days")
+
+def update_price_index(listings, complete, previous_index):
+    # Item id to price for each query, so the previous low is known without the old pages.
+    # After a failed page, listings beyond it may still be up, so none are dropped
+    prices = {key: listing['price_value'] for key, listing in listings.items()}
+    if not complete:
+        prices = {**previous_index.get('prices', {}), **prices}
+    return {'prices': prices, 'low': min(prices.values()) if prices else None, 'updated': time.time()}
+
+def alert_price(query, previous_index):
+    # New listings at or below this price are flagged: max_price when it's set, otherwise
+    # the lowest price the query had seen before this run
+    return query.get('max_price', previous_index.get('low'))
+
+def query_section(query, listings, new_keys, threshold):
+    display_count = options()['display_count']
+    term = query['term']
+    results_output = f"<h3>Ebay Search: {term}</h3>"
+    if not listings:
+        return results_output + "No listings found.<br>"
+    ranked = sorted(listings.items(), key=lambda entry: entry[1]['price_value'])
+    alerts = [(key, listing) for key, listing in ranked
+              if key in new_keys and threshold is not None and listing['price_value'] <= threshold]
+    if alerts:
+        results_output += f"<b>{len(alerts)} new at or below ${threshold:,.2f}:</b><br>"
+        for key, listing in alerts[:display_count]:
+            results_output += f"<a href='{listing['link']}'>{listing['title']}</a><br>Price: {listing['price']}<br><br>"
+    for key, listing in ranked[:display_count]:
+        new_mark = " (New!)" if key in new_keys else ""
+        output = (
+            f"<a href='{listing['link']}'>{listing['title']}</a>{new_mark}<br>"
+            f"Price: {listing['price']}<br><br>"
+        )
+        results_output += output
+    results_output += f"{len(listings)} listings, {len([key for key in listings if key in new_keys])} new<br>"
+    return results_output
 
 def get_ebay_results():
-    search_term = "rtx 3090"
-    ebay_results = scrape_ebay(search_term)
-    preprocessed_results = preprocess_results(ebay_results)
+    queries = watch_queries()
+    terms = [query['term'] for query in queries]
+
+    # Queries run concurrently; each follows its own result pages in order
+    with ThreadPoolExecutor(max_workers=options()['max_workers']) as executor:
+        searches = list(executor.map(tracing.propagate(search), terms))
+
+    # The same listing found by several queries is only stored and marked new once
+    found = {}
+    for term, (listings, complete) in zip(terms, searches):
+        record_prices(term, listings)
+        for key, listing in listings.items():
+            found.setdefault(key, (listing, []))[1].append(term)
+    new_keys = update_listings(found)
+
+    previous_indexes = state_store.get_many('ebay_index', terms)
+    indexes = {}
+    sections = []
+    for query, (listings, complete) in zip(queries, searches):
+        previous_index = previous_indexes.get(query['term'], {})
+        # The first run of a query has nothing to compare against, so nothing is marked
+        query_new_keys = new_keys if previous_index else set()
+        sections.append(query_section(query, listings, query_new_keys, alert_price(query, previous_index)))
+        if listings or complete:
+            indexes[query['term']] = update_price_index(listings, complete, previous_index)
+    state_store.upsert_records('ebay_index', indexes)
+    prune_listings()
+    tracing.found_new(len(new_keys))
 
     results_output = "<tr><td class='content'>"
-    results_output += f"<h3>Ebay Search: {search_term}</h3>"
-    for result in preprocessed_results[:5]:
-        output = (
-            f"<a href='{result['link']}'>{result['title']}</a><br>"
-            f"Price: {result['price']}<br><br>"
-        )
-        results_output += output
+    results_output += "".join(sections)
     results_output += "</td></tr>"
     return results_output
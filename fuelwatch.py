@@ -1,52 +1,156 @@
 import feedparser
-import requests
+import history
+import http_client
+import settings
+import tracing
 import urllib.parse  # To properly encode URL parameters
+from datetime import datetime
+from track_data import open_json, save_json
 
-# Set the locations
-locations = ["Osborne Park", "Canning Vale"]
+feed_url = "http://www.fuelwatch.wa.gov.au/fuelwatch/fuelWatchRSS"
 
-# Parse function from API
-def get_fuel(location, tomorrow=False):
-    params = {
-        'Product': 1,
-        'Suburb': location,
-        'Day': 'tomorrow' if tomorrow else 'today'
+# [fuelwatch] settings and their defaults
+defaults = {
+    # Set the locations
+    'suburbs': ["Osborne Park", "Canning Vale"],
+    # Specific stations to report, each in its own column in place of its suburb's cheapest
+    'stations': [{"suburb": "Canning Vale", "address": "6 Birnam Rd"}],
+    # A suburb's cheapest includes its surrounding suburbs, as FuelWatch's suburb search does.
+    # The region feed can't tell which suburbs surround another, so each such suburb costs
+    # one request per day; with surrounding = false they are all answered from the region feed
+    'surrounding': True,
+    # FuelWatch region fetched in one request per day (25 is Perth Metro) and fuel product (1 is ULP)
+    'region': 25,
+    'product': 1,
+}
+
+def options():
+    return settings.options('fuelwatch', defaults)
+
+def pinned_stations():
+    # (suburb, address) for each configured station
+    return [(station['suburb'], station['address']) for station in options()['stations']]
+
+# Prices are fixed per day, so each day's region feed is cached until the date changes
+cache_file = 'fuelwatch_cache.json'
+
+def station_record(entry):
+    return {
+        "location": entry["location"],
+        "address": entry["address"],
+        "brand": entry["brand"],
+        "price": entry["price"],
     }
-    response = requests.get("http://www.fuelwatch.wa.gov.au/fuelwatch/fuelWatchRSS", params=params, headers={"user-agent": "Mozilla/5.0"})
-    feed = feedparser.parse(response.content)
-
-    if feed['entries']:
-        # Custom logic for Canning Vale to select specific address
-        if location == "Canning Vale":
-            for entry in feed['entries']:
-                if entry.get("address") == "6 Birnam Rd":
-                    return {
-                        "location": entry["location"],
-                        "address": entry["address"],
-                        "brand": entry["brand"],
-                        "price": entry["price"],
-                        "date": "Tomorrow" if tomorrow else "Today",
-                    }
-        # Default behavior for other locations
-        else:
-            entry = feed['entries'][0]
-            return {
-                "location": entry["location"],
-                "address": entry["address"],
-                "brand": entry["brand"],
-                "price": entry["price"],
-                "date": "Tomorrow" if tomorrow else "Today",
-            }
-    return None  # Return None if no entry found
+
+def fetch_feed(params, tomorrow=False):
+    params = {'Product': options()['product'], 'Day': 'tomorrow' if tomorrow else 'today', **params}
+    response = http_client.get(feed_url, params=params)
+    with tracing.span('parse', bytes=len(response.content)) as span:
+        feed = feedparser.parse(response.content)
+        span['items'] = len(feed['entries'])
+    return [station_record(entry) for entry in feed['entries']]
+
+def fetch_daily(key, params, day):
+    # A feed for 'Today' or 'Tomorrow', cached under key for the rest of the day.
+    # Returns the entries and whether they were fetched just now
+    today = datetime.now().strftime('%Y-%m-%d')
+    cache = open_json(cache_file)
+    if cache.get('date') != today:
+        cache = {'date': today}
+    cache_key = f"{day}/{key}"
+    if cache_key in cache:
+        return cache[cache_key], False
+    entries = fetch_feed(params, tomorrow=(day == 'Tomorrow'))
+    # Tomorrow's prices are only published in the afternoon, so don't cache an empty feed
+    if entries:
+        cache[cache_key] = entries
+        save_json(cache_file, cache)
+    return entries, True
+
+def fetch_region(day):
+    # Whole-region feed, fetched once per day
+    entries, fresh = fetch_daily('region', {'Region': options()['region']}, day)
+    # Each station's price is archived once, on the day it applies
+    if fresh and entries and day == 'Today':
+        history.record('fuel', [(f"{entry['location']}/{entry['address']}", float(entry['price'])) for entry in entries])
+    return entries
+
+def build_index(entries):
+    # Stations keyed by suburb, address and brand; every list is cheapest first
+    index = {'suburb': {}, 'address': {}, 'brand': {}}
+    for entry in sorted(entries, key=lambda entry: float(entry['price'])):
+        index['suburb'].setdefault(entry['location'].lower(), []).append(entry)
+        index['address'].setdefault(entry['address'].lower(), []).append(entry)
+        index['brand'].setdefault(entry['brand'].lower(), []).append(entry)
+    return index
+
+def cheapest_in_suburb(index, suburb):
+    entries = index['suburb'].get(suburb.lower())
+    return entries[0] if entries else None
+
+def find_station(index, suburb, address):
+    for entry in index['address'].get(address.lower(), []):
+        if entry['location'].lower() == suburb.lower():
+            return entry
+    return None
+
+def cheapest_in_region(index, brand=None):
+    if brand:
+        entries = index['brand'].get(brand.lower())
+        return entries[0] if entries else None
+    return min((entries[0] for entries in index['suburb'].values()), key=lambda entry: float(entry['price']), default=None)
+
+def cheapest(entries):
+    return min(entries, key=lambda entry: float(entry['price']), default=None)
+
+# Parse function from API, for suburbs outside the cached region and surrounding-suburb searches
+def get_fuel(location, tomorrow=False, address=None, with_surrounding=False):
+    day = 'Tomorrow' if tomorrow else 'Today'
+    entries, _ = fetch_daily(f"{location}/{'surrounding' if with_surrounding else 'suburb'}",
+                             {'Suburb': location, 'Surrounding': 'yes' if with_surrounding else 'no'}, day)
+    if address:
+        return find_station(build_index(entries), location, address)
+    return cheapest(entries)
+
+def report_columns():
+    # (heading, suburb, address) per column: one for each pinned station, in its suburb's
+    # place, and one for the cheapest in every other suburb
+    stations = pinned_stations()
+    suburbs = list(dict.fromkeys(options()['suburbs'] + [suburb for suburb, _ in stations]))
+    columns = []
+    for suburb in suburbs:
+        pinned = [address for station_suburb, address in stations if station_suburb == suburb]
+        if not pinned:
+            columns.append((suburb, suburb, None))
+        for address in pinned:
+            columns.append((suburb if len(pinned) == 1 else f"{suburb} ({address})", suburb, address))
+    return columns
+
+def lookup(index, location, address, day):
+    tomorrow = day == 'Tomorrow'
+    if address:
+        entry = find_station(index, location, address)
+    elif options()['surrounding']:
+        return get_fuel(location, tomorrow=tomorrow, with_surrounding=True)
+    else:
+        entry = cheapest_in_suburb(index, location)
+    # Suburbs outside the region feed fall back to their own suburb feed
+    if entry is None and index['suburb'] and location.lower() not in index['suburb']:
+        entry = get_fuel(location, tomorrow=tomorrow, address=address)
+    return entry
 
 def generate_fuel_content():
     # Prepare data dictionary
-    data = {location: {'Today': None, 'Tomorrow': None} for location in locations}
+    station_columns = report_columns()
+    columns = [heading for heading, _, _ in station_columns] + ['Cheapest in Region']
+    data = {column: {'Today': None, 'Tomorrow': None} for column in columns}
 
-    # Fetch and organize data
-    for location in locations:
-        data[location]['Today'] = get_fuel(location)
-        data[location]['Tomorrow'] = get_fuel(location, tomorrow=True)
+    # Fetch the region once per day and answer every column it can from its index
+    for day in ['Today', 'Tomorrow']:
+        index = build_index(fetch_region(day))
+        for heading, location, address in station_columns:
+            data[heading][day] = lookup(index, location, address, day)
+        data['Cheapest in Region'][day] = cheapest_in_region(index)
 
     # Prepare HTML content with CSS
     my_html_tdst = '''
@@ -66,8 +170,10 @@ def generate_fuel_content():
     <thead>
     <tr>
         <th></th>
-        <th>Osborne Park</th>
-        <th>Canning Vale</th>
+    '''
+    for column in columns:
+        my_html_tdst += f'<th>{column}</th>'
+    my_html_tdst += '''
     </tr>
     </thead>
     <tbody>
@@ -76,15 +182,15 @@ def generate_fuel_content():
     # Add rows for Today and Tomorrow
     for day in ['Today', 'Tomorrow']:
         my_html_tdst += f'<tr><td>{day}</td>'
-        for location in locations:
-            if data[location][day]:
-                encoded_address = urllib.parse.quote_plus(data[location][day]["address"])
+        for column in columns:
+            if data[column][day]:
+                encoded_address = urllib.parse.quote_plus(data[column][day]["address"])
                 map_link = f"https://www.google.com/maps/search/?api=1&query={encoded_address}"
                 my_html_tdst += f'''
                 <td>
-                    <a href="{map_link}" target="_blank">{data[location][day]["address"]}</a><br>
-                    {data[location][day]["brand"]}<br>
-                    {data[location][day]["price"]} cpl<br>
+                    <a href="{map_link}" target="_blank">{data[column][day]["address"]}</a><br>
+                    {data[column][day]["brand"]}<br>
+                    {data[column][day]["price"]} cpl<br>
                 </td>
                 '''
             else:
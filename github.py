@@ -1,9 +1,12 @@
-import requests
-import toml
-from track_data import open_json, save_json
+import json
+from http_cache import cached_get, cached_post
+import settings
+import state_store
+import tracing
+from track_data import open_records
 
-# List of repositories to track
-repositories = [
+# Repositories tracked when settings.toml doesn't list any
+default_repositories = [
     "theroyallab/tabbyAPI",
     "SillyTavern/SillyTavern",
     "LostRuins/koboldcpp",
@@ -11,29 +14,40 @@ repositories = [
     "comfyanonymous/ComfyUI"
 ]
 
-config = toml.load("settings.toml")
+# [github] settings and their defaults
+defaults = {
+    # List of repositories to track
+    'repositories': default_repositories,
+    # "graphql" fetches every repository in a few batched queries, "rest" makes one or two calls per repository
+    'mode': 'graphql',
+    # Repositories per GraphQL query, kept well inside the query cost limit
+    'batch_size': 50,
+    # GraphQL answers carry no validators to revalidate with, so a batch is reused for this many seconds
+    'graphql_ttl': 300,
+}
 
-# Your GitHub personal access token
-access_token = config['github']['auth_token']
+def options():
+    return settings.options('github', defaults)
 
-# Headers to use in the API request
-headers = {
-    'Authorization': f'token {access_token}',
-    'Accept': 'application/vnd.github.v3+json'
-}
+def request_headers():
+    # Headers to use in the API request, with your GitHub personal access token
+    return {
+        'Authorization': f"token {options()['auth_token']}",
+        'Accept': 'application/vnd.github.v3+json'
+    }
 
 # Base URL for GitHub API
 base_url = 'https://api.github.com/repos/'
+graphql_url = 'https://api.github.com/graphql'
 
-# File to store the last known releases and commits
+# Legacy file that stored the last known releases and commits, imported into the state store once
 tracking_file = 'github.json'
-tracking_data = open_json(tracking_file)
 
 # Function to get the latest commit from the default branch
 def get_latest_commit(repo):
     url = f"{base_url}{repo}/commits"
     params = {'per_page': 1}  # Fetch only the latest commit
-    response = requests.get(url, headers=headers, params=params)
+    response = cached_get(url, headers=request_headers(), params=params)
     if response.status_code == 200:
         data = response.json()
         return data[0]['sha'], data[0]['commit']['message']  # Return the SHA and message of the latest commit
@@ -43,7 +57,8 @@ def get_latest_commit(repo):
 # Function to get the latest release or commit
 def get_latest_release_or_commit(repo):
     url = f"{base_url}{repo}/releases/latest"
-    response = requests.get(url, headers=headers)
+    # Conditional requests answered with 304 don't count against the rate limit
+    response = cached_get(url, headers=request_headers())
     if response.status_code == 200:
         data = response.json()
         return 'release', data.get('id'), data.get('tag_name')  # Returning type, ID, and tag name (version)
@@ -57,12 +72,64 @@ def get_latest_release_or_commit(repo):
     else:
         return 'error', None, None
 
+# Build one GraphQL query covering a batch of repositories, each under its own alias
+def build_batch_query(repos):
+    fields = []
+    for i, repo in enumerate(repos):
+        owner, name = repo.split('/', 1)
+        fields.append(
+            f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ '
+            'latestRelease { databaseId tagName } '
+            'defaultBranchRef { target { ... on Commit { oid message } } } }'
+        )
+    return "query { " + " ".join(fields) + " }"
+
+# Function to get the latest release or commit for every repository in batched GraphQL queries.
+# Repositories in a failed batch, or missing from a batch's answer, are left out
+def get_latest_batch(repos):
+    config = options()
+    batch_size = config['batch_size']
+    results = {}
+    for start in range(0, len(repos), batch_size):
+        batch = repos[start:start + batch_size]
+        response = cached_post(graphql_url, {'query': build_batch_query(batch)}, headers=request_headers(), ttl=config['graphql_ttl'])
+        if response.status_code != 200:
+            print(f"GitHub GraphQL query failed: {response.status_code}")
+            continue
+        data = response.json().get('data') or {}
+        for i, repo in enumerate(batch):
+            repository = data.get(f'r{i}')
+            if not repository:
+                continue
+            elif repository['latestRelease']:
+                # databaseId matches the REST release id already stored in github.json
+                release = repository['latestRelease']
+                results[repo] = ('release', release['databaseId'], release['tagName'])
+            elif repository['defaultBranchRef'] and repository['defaultBranchRef']['target']:
+                commit = repository['defaultBranchRef']['target']
+                results[repo] = ('commit', commit['oid'], commit['message'])
+            else:
+                results[repo] = ('error', None, None)
+    return results
+
 # Function to collect status updates as a string
 def get_status_updates():
+    config = options()
+    repositories = config['repositories']
+    # Batched GraphQL needs a token; repositories it didn't answer for fall back to REST calls
+    latest = get_latest_batch(repositories) if config['mode'] == 'graphql' else {}
+    for repo in repositories:
+        if repo not in latest:
+            latest[repo] = get_latest_release_or_commit(repo)
+
+    # Last known release or commit per repository, and the ones that changed this run
+    tracking_data = open_records('github', tracking_file)
+    changed = {}
+
     status_updates = "<tr><td class='content'>"
     status_updates += f"<h3>Github Repo Updates</h3>"
     for repo in repositories:
-        item_type, item_id, item_name = get_latest_release_or_commit(repo)
+        item_type, item_id, item_name = latest[repo]
         repo_link = f"https://github.com/{repo}"  # Creating link to the repository
         if item_type != 'error' and item_id:
             if repo not in tracking_data or tracking_data[repo] != item_id:
@@ -70,7 +137,7 @@ def get_status_updates():
                     status_updates += f"<a href='{repo_link}'>{repo}</a><br>New release<br>Version: {item_name}<br><br>"
                 else:
                     status_updates += f"<a href='{repo_link}'>{repo}</a><br>New commit<br>Message: {item_name}<br><br>"
-                tracking_data[repo] = item_id
+                changed[repo] = item_id
             else:
                 if item_type == 'release':
                     status_updates += f"<a href='{repo_link}'>{repo}</a><br>No new release<br>Current Version: {item_name}<br><br>"
@@ -81,6 +148,7 @@ def get_status_updates():
     
     status_updates += "</td></tr>"
 
-    save_json(tracking_file, tracking_data)
+    state_store.upsert_records('github', changed)
+    tracing.found_new(len(changed))
 
     return ''.join(status_updates)
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import tracing
+
+# Append-only archive of every scraped observation. Each source (ebay, huggingface,
+# steam, fuel) has one raw file of fixed-size records in time order, plus daily,
+# weekly and monthly rollups per series that are updated as observations arrive
+history_dir = "history"
+
+record_dtype = np.dtype([('t', '<i8'), ('series', '<i4'), ('value', '<f4')])
+rollup_dtype = np.dtype([('series', '<i4'), ('bucket', '<i8'), ('count', '<i4'), ('mean', '<f4'),
+                         ('min', '<f4'), ('max', '<f4'), ('median', '<f4')])
+periods = ['daily', 'weekly', 'monthly']
+
+_lock = threading.Lock()
+
+def source_path(source, suffix):
+    return os.path.join(history_dir, f"{source}.{suffix}")
+
+def load_series_ids(source):
+    try:
+        with open(source_path(source, 'series.json'), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def save_file(path, write):
+    # Write then rename so a crash never leaves a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        write(file)
+    os.replace(tmp_path, path)
+
+def load_records(source):
+    path = source_path(source, 'bin')
+    count = os.path.getsize(path) // record_dtype.itemsize if os.path.exists(path) else 0
+    if not count:
+        return np.zeros(0, dtype=record_dtype)
+    # Only whole records are mapped, in case an append was cut short
+    return np.memmap(path, dtype=record_dtype, mode='r', shape=(count,))
+
+def trim_partial_record(path):
+    # Drop the tail of an append that was cut short, so new records stay aligned
+    if os.path.exists(path):
+        size = os.path.getsize(path)
+        if size % record_dtype.itemsize:
+            print(f"Truncating a partial record at the end of {path}")
+            os.truncate(path, size - size % record_dtype.itemsize)
+
+def load_rollup(source, period):
+    path = source_path(source, f'{period}.npy')
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=rollup_dtype)
+    return np.load(path)
+
+def buckets(t, period):
+    days = (t // 86400).astype(np.int64)
+    if period == 'daily':
+        return days
+    if period == 'weekly':
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        return (days + 3) // 7
+    return t.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+def bucket_start(bucket, period):
+    # First second of a bucket, so the raw rows behind it can be found
+    if period == 'daily':
+        return int(bucket) * 86400
+    if period == 'weekly':
+        return (int(bucket) * 7 - 3) * 86400
+    return int(np.datetime64(int(bucket), 'M').astype('datetime64[s]').astype(np.int64))
+
+def summarise(rows, period):
+    # Count/mean/min/max/median for every (series, bucket) group of raw rows at once
+    bucket = buckets(rows['t'], period)
+    order = np.lexsort((rows['value'], bucket, rows['series']))
+    series, bucket, values = rows['series'][order], bucket[order], rows['value'][order].astype(np.float64)
+    starts = np.flatnonzero(np.r_[True, (series[1:] != series[:-1]) | (bucket[1:] != bucket[:-1])])
+    counts = np.diff(np.r_[starts, len(values)])
+    # Values are sorted within each group, so the median sits in the middle
+    middle_low = starts + (counts - 1) // 2
+    middle_high = starts + counts // 2
+    summary = np.zeros(len(starts), dtype=rollup_dtype)
+    summary['series'] = series[starts]
+    summary['bucket'] = bucket[starts]
+    summary['count'] = counts
+    summary['mean'] = np.add.reduceat(values, starts) / counts
+    summary['min'] = values[starts]
+    summary['max'] = values[starts + counts - 1]
+    summary['median'] = (values[middle_low] + values[middle_high]) / 2
+    return summary
+
+def update_rollups(source, records, new_rows):
+    for period in periods:
+        new_buckets = buckets(new_rows['t'], period)
+        # Only the raw rows from the earliest touched bucket onwards are read back
+        since = bucket_start(new_buckets.min(), period)
+        tail = np.asarray(records[np.searchsorted(records['t'], since):])
+        touched = np.isin(tail['series'], np.unique(new_rows['series'])) & (buckets(tail['t'], period) >= new_buckets.min())
+        fresh = summarise(tail[touched], period)
+
+        rollup = load_rollup(source, period)
+        # One int64 key per (series, bucket); the int32 series id is widened before it's scaled
+        keep = ~np.isin(rollup['series'].astype(np.int64) * 1_000_000_000 + rollup['bucket'],
+                        fresh['series'].astype(np.int64) * 1_000_000_000 + fresh['bucket'])
+        rollup = np.concatenate([rollup[keep], fresh])
+        rollup = rollup[np.lexsort((rollup['bucket'], rollup['series']))]
+        save_file(source_path(source, f'{period}.npy'), lambda file: np.save(file, rollup))
+
+def record(source, observations):
+    # observations is a list of (series name, value) pairs; a series may appear more
+    # than once, e.g. one eBay price per listing for the same search
+    observations = [(name, value) for name, value in observations if value is not None and np.isfinite(value)]
+    if not observations:
+        return
+    tracing.check_deadline('history write')
+    with _lock, tracing.span('state', items=len(observations)):
+        os.makedirs(history_dir, exist_ok=True)
+        series_ids = load_series_ids(source)
+        for name, _ in observations:
+            series_ids.setdefault(name, len(series_ids))
+        save_file(source_path(source, 'series.json'), lambda file: file.write(json.dumps(series_ids).encode()))
+
+        trim_partial_record(source_path(source, 'bin'))
+        records = load_records(source)
+        # Timestamps never go backwards, which keeps the raw file sorted for searchsorted
+        now = max(int(time.time()), int(records['t'][-1]) if len(records) else 0)
+        new_rows = np.zeros(len(observations), dtype=record_dtype)
+        new_rows['t'] = now
+        new_rows['series'] = [series_ids[name] for name, _ in observations]
+        new_rows['value'] = [value for _, value in observations]
+        del records
+        with open(source_path(source, 'bin'), 'ab') as file:
+            file.write(new_rows.tobytes())
+
+        update_rollups(source, load_records(source), new_rows)
+
+def query(source, series, days=90, period='daily'):
+    # Precomputed rollup rows for one series over the last `days` days
+    series_id = load_series_ids(source).get(series)
+    rollup = load_rollup(source, period)
+    if series_id is None or not len(rollup):
+        return np.zeros(0, dtype=rollup_dtype)
+    since = buckets(np.array([int(time.time()) - days * 86400]), period)[0]
+    start, end = np.searchsorted(rollup['series'], [series_id, series_id + 1])
+    rows = rollup[start:end]
+    return rows[rows['bucket'] >= since]
+
+def window_stat(source, series, days=90, stat='median'):
+    # Exact statistic over the raw observations of the last `days` days; only the
+    # tail of the raw file is read
+    series_id = load_series_ids(source).get(series)
+    if series_id is None:
+        return None
+    records = load_records(source)
+    tail = records[np.searchsorted(records['t'], int(time.time()) - days * 86400):]
+    values = np.asarray(tail['value'][tail['series'] == series_id], dtype=np.float64)
+    if not len(values):
+        return None
+    return float(getattr(np, stat)(values))
+
+def parse_count(text):
+    # Abbreviated counts as shown on Hugging Face, e.g. "1.2k" or "3M"
+    text = str(text).strip().replace(',', '')
+    multiplier = {'k': 1e3, 'm': 1e6, 'b': 1e9}.get(text[-1:].lower(), 1)
+    try:
+        return float(text[:-1] if multiplier != 1 else text) * multiplier
+    except ValueError:
+        return None
+
+if __name__ == "__main__":
+    # e.g. python history.py ebay "rtx 3090" --days 90 --stat median
+    import argparse
+    parser = argparse.ArgumentParser(description="Query the scraped metrics history")
+    parser.add_argument('source', help="ebay, huggingface, steam or fuel")
+    parser.add_argument('series', help="Series name, e.g. a search term or 'model/downloads'")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--stat', default='median', help="Any numpy reduction: median, mean, min, max")
+    parser.add_argument('--period', choices=periods, help="Print the precomputed rollup rows instead")
+    args = parser.parse_args()
+
+    if args.period:
+        for row in query(args.source, args.series, args.days, args.period):
+            print(f"{np.datetime64(bucket_start(row['bucket'], args.period), 's').astype('datetime64[D]')} count={row['count']} mean={row['mean']:.2f} min={row['min']:.2f} "
+                  f"max={row['max']:.2f} median={row['median']:.2f}")
+    else:
+        print(window_stat(args.source, args.series, args.days, args.stat))
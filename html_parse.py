@@ -0,0 +1,25 @@
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+import tracing
+
+def has_class(name):
+    # Matches one class among several; during a strained parse bs4 may still see the
+    # raw space-separated class string, so a plain class_='name' would miss it
+    return re.compile(rf'(^|\s){re.escape(name)}(\s|$)')
+
+# The only elements each scraper reads. Everything outside them is skipped while
+# parsing, so the tree for a large results page stays small
+extraction_rules = {
+    'ebay': SoupStrainer('li', class_=has_class('s-item')),
+    'steam_wishlist': SoupStrainer('a', class_=has_class('search_result_row')),
+    'huggingface': SoupStrainer('article', class_=has_class('overview-card-wrapper')),
+    'tcbscans': SoupStrainer('a', class_=has_class('block')),
+}
+
+def parse(source, markup):
+    # lxml is the fastest backend bs4 supports with parse_only
+    with tracing.span('parse', bytes=len(markup)) as span:
+        soup = BeautifulSoup(markup, 'lxml', parse_only=extraction_rules[source])
+        # With parse_only the top level holds just the matched elements
+        span['items'] = len(soup.contents)
+        return soup
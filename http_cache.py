@@ -0,0 +1,199 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+import http_client
+
+# On-disk response cache with ETag/Last-Modified revalidation
+cache_dir = "http_cache"
+index_file = os.path.join(cache_dir, "index.json")
+
+# Least recently used entries are evicted once bodies exceed this many bytes
+max_cache_bytes = 50 * 1024 * 1024
+
+_lock = threading.Lock()
+_index = None
+
+# Set when the in-memory index has changes not yet written, e.g. the last_used touch
+# of an entry served inside its ttl
+_dirty = False
+
+class CachedResponse:
+    # The parts of a requests.Response the scrapers use, for live or cached bodies
+    def __init__(self, status_code, content, encoding='utf-8', from_cache=False, not_modified=False):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.from_cache = from_cache
+        self.not_modified = not_modified
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise http_client.requests.HTTPError(f"{self.status_code} Error")
+
+def cache_key(url, params=None, body=None):
+    if params:
+        url = f"{url}?{urlencode(sorted(params.items()), doseq=True)}"
+    if body is not None:
+        # POSTed queries are cached per request body
+        url = f"{url}#{json.dumps(body, sort_keys=True)}"
+    return hashlib.sha1(url.encode()).hexdigest()
+
+def entry_path(key, suffix):
+    return os.path.join(cache_dir, f"{key}.{suffix}")
+
+def load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(index_file, 'r') as file:
+                _index = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _index = {}
+    return _index
+
+def write_file(path, data, mode='wb'):
+    # Write then rename so readers never see a partial file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+def save_index():
+    global _dirty
+    write_file(index_file, json.dumps(_index), mode='w')
+    _dirty = False
+
+def flush_index():
+    # Touches are written with the next index write, or here at exit, so a one-shot
+    # cron run still records which entries it used
+    with _lock:
+        if _dirty and _index is not None:
+            save_index()
+
+atexit.register(flush_index)
+
+def entry_size(entry):
+    # The body plus its stored parse result
+    return entry['size'] + entry.get('parsed_size', 0)
+
+def remove_entry(index, key):
+    index.pop(key, None)
+    for suffix in ('body', 'parsed.json'):
+        try:
+            os.remove(entry_path(key, suffix))
+        except FileNotFoundError:
+            pass
+
+def evict(index):
+    total = sum(entry_size(entry) for entry in index.values())
+    for key in sorted(index, key=lambda key: index[key]['last_used']):
+        if total <= max_cache_bytes:
+            break
+        total -= entry_size(index[key])
+        remove_entry(index, key)
+
+def read_body(key):
+    try:
+        with open(entry_path(key, 'body'), 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+def cached_get(url, params=None, headers=None, ttl=0, **kwargs):
+    return cached_request('GET', url, params=params, headers=headers, ttl=ttl, **kwargs)
+
+def cached_post(url, body, headers=None, ttl=0, **kwargs):
+    # For JSON query APIs such as GitHub GraphQL. Validators are sent when the server
+    # gave any, but APIs without them are only cached for ttl seconds
+    return cached_request('POST', url, headers=headers, ttl=ttl, json_body=body, **kwargs)
+
+def cached_request(method, url, params=None, headers=None, ttl=0, json_body=None, **kwargs):
+    global _dirty
+    # Serve from cache inside ttl seconds, otherwise revalidate with the stored validators
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cache_key(url, params, json_body)
+    with _lock:
+        entry = dict(load_index().get(key) or {})
+    body = read_body(key) if entry else None
+    if body is None:
+        entry = {}
+
+    now = time.time()
+    if entry and now - entry['fetched_at'] < ttl:
+        with _lock:
+            if key in load_index():
+                load_index()[key]['last_used'] = now
+                _dirty = True
+        return CachedResponse(200, body, entry.get('encoding'), from_cache=True, not_modified=True)
+
+    request_headers = dict(headers or {})
+    if entry.get('etag'):
+        request_headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        request_headers['If-Modified-Since'] = entry['last_modified']
+    if json_body is not None:
+        kwargs['json'] = json_body
+    response = http_client.request(method, url, params=params, headers=request_headers, **kwargs)
+
+    with _lock:
+        index = load_index()
+        if response.status_code == 304 and entry:
+            index[key] = {**entry, 'fetched_at': now, 'last_used': now}
+            save_index()
+            return CachedResponse(200, body, entry.get('encoding'), from_cache=True, not_modified=True)
+
+        if response.status_code == 200:
+            write_file(entry_path(key, 'body'), response.content)
+            # A new body invalidates any parse result stored for the old one
+            try:
+                os.remove(entry_path(key, 'parsed.json'))
+            except FileNotFoundError:
+                pass
+            index[key] = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'encoding': response.encoding,
+                'fetched_at': now,
+                'last_used': now,
+                'size': len(response.content),
+            }
+            evict(index)
+            save_index()
+
+    return CachedResponse(response.status_code, response.content, response.encoding)
+
+def cached_parse(url, parse, params=None, headers=None, ttl=0, **kwargs):
+    # Returns (status_code, parsed). When the body is unchanged the stored parse result
+    # is reused, so 304s and fresh entries skip HTML parsing entirely
+    response = cached_get(url, params=params, headers=headers, ttl=ttl, **kwargs)
+    if response.status_code != 200:
+        return response.status_code, None
+
+    key = cache_key(url, params)
+    parsed_path = entry_path(key, 'parsed.json')
+    if response.not_modified and os.path.exists(parsed_path):
+        with open(parsed_path, 'r') as file:
+            return response.status_code, json.load(file)
+
+    parsed = parse(response)
+    with _lock:
+        index = load_index()
+        if key in index:
+            data = json.dumps(parsed)
+            write_file(parsed_path, data, mode='w')
+            index[key]['parsed_size'] = len(data)
+            evict(index)
+            save_index()
+    return response.status_code, parsed
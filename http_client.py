@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import tracing
+
+# Connect and read timeouts in seconds
+default_timeout = (10, 30)
+
+# Retries for connection errors and these statuses, with jittered exponential backoff
+max_retries = 3
+retry_statuses = {429, 500, 502, 503, 504}
+backoff_base = 1.0
+backoff_max = 30.0
+
+default_headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36',
+}
+
+# Minimum seconds between requests to the same host
+default_host_interval = 0.25
+host_intervals = {
+    'www.ebay.com.au': 1.0,
+    'store.steampowered.com': 0.5,
+    'huggingface.co': 0.5,
+}
+
+_sessions = {}
+_next_request = {}
+_lock = threading.Lock()
+
+def session_for(host):
+    # One keep-alive session per host so repeated calls reuse the connection
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+def wait_for_host(host):
+    # Reserve the next request slot for the host, then sleep until it comes round
+    interval = host_intervals.get(host, default_host_interval)
+    with _lock:
+        now = time.monotonic()
+        slot = max(now, _next_request.get(host, now))
+        _next_request[host] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+def backoff_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(float(retry_after), backoff_max)
+    # Full jitter so parallel modules don't retry in lockstep
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+def request(method, url, **kwargs):
+    with tracing.span('fetch', host=urlsplit(url).hostname) as span:
+        response = perform_request(method, url, **kwargs)
+        span['status'] = response.status_code
+        span['bytes'] = len(response.content)
+        return response
+
+def perform_request(method, url, headers=None, timeout=None, retries=None, **kwargs):
+    host = urlsplit(url).hostname
+    session = session_for(host)
+    headers = {**default_headers, **(headers or {})}
+    timeout = timeout or default_timeout
+    retries = max_retries if retries is None else retries
+
+    for attempt in range(retries + 1):
+        # A module past its deadline makes no more requests, and never waits out a
+        # backoff or read timeout beyond it
+        tracing.check_deadline(f"request to {host}")
+        wait_for_host(host)
+        try:
+            response = session.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Request to {host} failed ({e}), retrying in {delay:.1f}s")
+        else:
+            if response.status_code not in retry_statuses or attempt == retries:
+                return response
+            delay = backoff_delay(attempt, response)
+            print(f"Request to {host} returned {response.status_code}, retrying in {delay:.1f}s")
+        left = tracing.time_left()
+        time.sleep(delay if left is None else max(0, min(delay, left)))
+
+def get(url, params=None, **kwargs):
+    return request('GET', url, params=params, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -1,24 +1,168 @@
-import requests
-from bs4 import BeautifulSoup
-from track_data import open_json, save_json
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http_cache import cached_parse
+from html_parse import parse
+import history
+import settings
+import state_store
+import tracing
+from track_data import migrate_records
+
+# Trending results are reused for an hour before the page is revalidated
+cache_ttl = 3600
+
+api_url = "https://huggingface.co/api/models"
+
+# Only these fields are requested from the models API
+api_fields = ['downloads', 'likes', 'createdAt', 'trendingScore']
+
+# [huggingface] settings and their defaults
+defaults = {
+    # "api" runs every query against the JSON models API; "html" scrapes the trending page for "12b"
+    'mode': 'api',
+    'queries': ["12b"],
+    'sort': 'trendingScore',
+    # Models fetched per query, and shown in the email
+    'limit': 20,
+    'display_count': 6,
+}
+
+def options():
+    return settings.options('huggingface', defaults)
+
+def parse_models(response):
+    # Parse only the model cards out of the HTML content
+    soup = parse('huggingface', response.content)
+
+    # Find all the relevant article elements with the class 'overview-card-wrapper group/repo'
+    models = soup.find_all("article", class_="overview-card-wrapper group/repo")
+
+    parsed_models = []
+    for model in models[:6]:
+        # Extract the link
+        link = model.find("a", class_="flex items-center justify-between gap-4 p-2")['href']
+        # Extract the release date
+        release_date = model.find("time").text.strip()
+
+        # Extract all SVG icons and their associated text
+        svg_elements = model.find_all("svg", {"aria-hidden": "true"})
+        svg_texts = [svg.find_next_sibling(string=True).strip() for svg in svg_elements]
+
+        # Determine if 'type' is present (i.e., more than 2 SVG elements)
+        if len(svg_texts) > 2:
+            # Assume the first SVG is 'type' and discard it
+            downloads = svg_texts[1]
+            likes = svg_texts[2]
+        elif len(svg_texts) == 2:
+            # No 'type' present, so use the first two directly
+            downloads = svg_texts[0]
+            likes = svg_texts[1]
+        else:
+            downloads = "Unknown"
+            likes = "Unknown"
+
+        parsed_models.append({
+            "link": link,
+            "release_date": release_date,
+            "downloads": downloads,
+            "likes": likes
+        })
+    return parsed_models
+
+def parse_api_models(response):
+    return [{
+        'id': model['id'],
+        'release_date': (model.get('createdAt') or '')[:10],
+        'downloads': model.get('downloads', 0),
+        'likes': model.get('likes', 0),
+        'trending_score': model.get('trendingScore', 0),
+    } for model in json.loads(response.content)]
+
+def fetch_query(query):
+    config = options()
+    params = {'search': query, 'sort': config['sort'], 'direction': -1, 'limit': config['limit'], 'expand[]': api_fields}
+    status_code, models = cached_parse(api_url, parse_api_models, params=params, ttl=cache_ttl)
+    if status_code != 200:
+        print(f"Hugging Face query {query} failed: {status_code}")
+        return []
+    return models
+
+def fetch_model_index():
+    # Every query runs concurrently and the results are merged into one index keyed by
+    # model id; a model found by several queries is kept once, with all of them listed
+    queries = options()['queries']
+    if not queries:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        results = list(executor.map(tracing.propagate(fetch_query), queries))
+    index = {}
+    for query, models in zip(queries, results):
+        for model in models:
+            entry = index.setdefault(model['id'], {**model, 'queries': []})
+            entry['queries'].append(query)
+    return index
+
+def count_change(current, previous):
+    change = current - previous
+    return f" ({change:+,})" if change else ""
+
+def get_model_index_html():
+    config = options()
+    index = fetch_model_index()
+    if not index:
+        return "<tr><td class='content'><h3>Hugging Face Models</h3>Failed to retrieve models.</td></tr>"
+
+    # Only the fetched models are read back and written, the rest of the index is left alone
+    previous = state_store.get_many('huggingface_models', index)
+    now = time.time()
+    changed = {}
+    for model_id, model in index.items():
+        record = {key: model[key] for key in ('release_date', 'downloads', 'likes', 'trending_score')}
+        old = previous.get(model_id)
+        if old is None or any(old.get(key) != value for key, value in record.items()):
+            changed[model_id] = {**record, 'first_seen': old['first_seen'] if old else now, 'updated': now}
+    state_store.upsert_records('huggingface_models', changed)
+    tracing.found_new(len(index.keys() - previous.keys()))
+
+    # Series are keyed by the full repo id, so same-named models from different owners stay apart
+    history.record('huggingface', [(f"{model_id}/{field}", model[field])
+                                   for model_id, model in index.items() for field in ('downloads', 'likes')])
+
+    ranked = sorted(index.values(), key=lambda model: model['trending_score'], reverse=True)
+    html_output = f"<tr><td class='content'><h3>Hugging Face Models: {', '.join(config['queries'])}</h3>"
+    for position, model in enumerate(ranked[:config['display_count']], start=1):
+        old = previous.get(model['id'])
+        full_link = f"https://huggingface.co/{model['id']}"
+        html_output += f'<div>{position}. <a href="{full_link}" target="_blank">{model["id"].split("/")[-1]}</a>'
+        if old is None:
+            html_output += " (New!)"
+        html_output += f' [{", ".join(model["queries"])}]'
+        html_output += f'<br>  Released: {model["release_date"]}<br>'
+        html_output += f'  Downloads: {model["downloads"]:,}{count_change(model["downloads"], old["downloads"]) if old else ""}<br>'
+        html_output += f'  Likes: {model["likes"]:,}{count_change(model["likes"], old["likes"]) if old else ""}<br><br></div>'
+    html_output += "</td></tr>"
+    return html_output
 
 def scrape_huggingface_models():
+    if options()['mode'] == 'api':
+        return get_model_index_html()
+
     tracking_file = 'huggingface.json'
-    tracking_data = open_json(tracking_file)
+    migrate_records('huggingface', tracking_file)
     
     # The URL to scrape
     url = "https://huggingface.co/models?sort=trending&search=12b"
 
-    # Send a GET request to the URL
-    response = requests.get(url)
+    # Fetch and parse the page, reusing the previous parse when it hasn't changed
+    status_code, models = cached_parse(url, parse_models, ttl=cache_ttl)
+
+    # An empty page (e.g. after a layout change) is treated like a failed fetch, so the
+    # stored models are kept
+    if status_code == 200 and models:
+        # Indexed lookup of which of these models were seen last run
+        previous_titles = state_store.existing_keys('huggingface', [model["link"].split("/")[-1] for model in models])
 
-    if response.status_code == 200:
-        # Parse the HTML content using BeautifulSoup
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        # Find all the relevant article elements with the class 'overview-card-wrapper group/repo'
-        models = soup.find_all("article", class_="overview-card-wrapper group/repo")
-        
         # Initialize data storage for the current run
         current_data = {}
         html_output = "<tr><td class='content'><h3>Hugging Face Models: 12b</h3>"
@@ -26,35 +170,18 @@ def scrape_huggingface_models():
         # Index to track each model entry
         index = 1
         
-        for model in models[:6]: 
-            # Extract the link
-            link = model.find("a", class_="flex items-center justify-between gap-4 p-2")['href']
+        for model in models:
+            link = model["link"]
             # Full link for correct redirection
             full_link = f"https://huggingface.co{link}"
             # Extract the title (assuming the title is in the link text)
             title = link.split("/")[-1]
-            # Extract the release date
-            release_date = model.find("time").text.strip()
-            
-            # Extract all SVG icons and their associated text
-            svg_elements = model.find_all("svg", {"aria-hidden": "true"})
-            svg_texts = [svg.find_next_sibling(string=True).strip() for svg in svg_elements]
-            
-            # Determine if 'type' is present (i.e., more than 2 SVG elements)
-            if len(svg_texts) > 2:
-                # Assume the first SVG is 'type' and discard it
-                downloads = svg_texts[1]
-                likes = svg_texts[2]
-            elif len(svg_texts) == 2:
-                # No 'type' present, so use the first two directly
-                downloads = svg_texts[0]
-                likes = svg_texts[1]
-            else:
-                downloads = "Unknown"
-                likes = "Unknown"
+            release_date = model["release_date"]
+            downloads = model["downloads"]
+            likes = model["likes"]
             
             # Check if this model is new compared to the previous data
-            is_new = title not in tracking_data
+            is_new = title not in previous_titles
             
             # Store the current data
             current_data[title] = {
@@ -77,13 +204,17 @@ def scrape_huggingface_models():
         
         html_output += "</tr></td>"
         
+        # Archive the download and like counts before the snapshot is replaced
+        history.record('huggingface', [(f"{title}/{field}", history.parse_count(model[field]))
+                                       for title, model in current_data.items() for field in ('downloads', 'likes')])
+
         # Update the tracking data with the current data
-        save_json(tracking_file, current_data)  # Save the current data, not the original tracking data
+        state_store.replace_records('huggingface', current_data)  # Save the current data, not the original tracking data
         
         # Return the HTML string
         return html_output
 
     else:
-        return f"<p>Failed to retrieve content. Status code: {response.status_code}</p>"
+        return f"<p>Failed to retrieve content. Status code: {status_code}</p>"
 
 #print(scrape_huggingface_models())
\ No newline at end of file
@@ -0,0 +1,139 @@
+import argparse
+import csv
+import math
+import time
+from track_data import open_json, save_json
+
+# Running moving averages with O(1) work per bar, for the stock report's golden cross
+# flag and for alerting on a bar stream. Only the current windows are kept, so the
+# charted moving average series still come from analytics.compute_analytics
+
+# Moving average windows used by the stock report
+short_window = 50
+long_window = 200
+
+# File holding the running window state for the daily report
+state_file = 'indicators.json'
+
+def new_window(size):
+    return {'size': size, 'buffer': [], 'pos': 0, 'sum': 0.0}
+
+def push(window, value):
+    # Ring buffer with a running sum, so each bar costs O(1)
+    buffer = window['buffer']
+    if len(buffer) < window['size']:
+        buffer.append(value)
+        window['sum'] += value
+    else:
+        window['sum'] += value - buffer[window['pos']]
+        buffer[window['pos']] = value
+        window['pos'] = (window['pos'] + 1) % window['size']
+        # Re-sum once per full cycle so floating point drift never accumulates
+        if window['pos'] == 0:
+            window['sum'] = math.fsum(buffer)
+
+def mean(window):
+    if len(window['buffer']) < window['size']:
+        return None
+    return window['sum'] / window['size']
+
+def new_ticker_state():
+    return {
+        'last_date': None,
+        'short': new_window(short_window),
+        'long': new_window(long_window),
+        'short_ma': None,
+        'long_ma': None,
+        'golden_cross': False,
+        'death_cross': False,
+    }
+
+def update_bar(state, ticker, date, close):
+    ticker_state = state.setdefault(ticker, new_ticker_state())
+    # Bars at or before the last one seen are ignored, so replays are idempotent
+    if ticker_state['last_date'] is not None and date <= ticker_state['last_date']:
+        return None
+
+    previous_short = ticker_state['short_ma']
+    previous_long = ticker_state['long_ma']
+    push(ticker_state['short'], close)
+    push(ticker_state['long'], close)
+    short_ma = mean(ticker_state['short'])
+    long_ma = mean(ticker_state['long'])
+
+    crossable = None not in (previous_short, previous_long, short_ma, long_ma)
+    golden_cross = crossable and short_ma > long_ma and previous_short <= previous_long
+    death_cross = crossable and short_ma < long_ma and previous_short >= previous_long
+
+    ticker_state.update({
+        'last_date': date,
+        'short_ma': short_ma,
+        'long_ma': long_ma,
+        'golden_cross': golden_cross,
+        'death_cross': death_cross,
+    })
+    return {
+        'ticker': ticker,
+        'date': date,
+        'close': close,
+        'short_ma': short_ma,
+        'long_ma': long_ma,
+        'golden_cross': golden_cross,
+        'death_cross': death_cross,
+    }
+
+def sync_series(state, ticker, close):
+    # Feed only the bars of a date-indexed close series newer than the stored state
+    ticker_state = state.get(ticker)
+    if ticker_state and ticker_state['last_date']:
+        close = close[close.index > ticker_state['last_date']]
+    for date, value in close.dropna().items():
+        update_bar(state, ticker, date.strftime('%Y-%m-%d'), float(value))
+    return state[ticker] if ticker in state else new_ticker_state()
+
+def load_state(file_name=state_file):
+    return open_json(file_name)
+
+def save_state(state, file_name=state_file):
+    save_json(file_name, state)
+
+def read_bar_stream(path, follow=False, poll_interval=1.0):
+    # Bars are CSV rows of timestamp,ticker,close; follow=True keeps tailing the file
+    # so a local feed process can append bars as they arrive
+    with open(path, 'r', newline='') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                if not follow:
+                    return
+                time.sleep(poll_interval)
+                continue
+            row = next(csv.reader([line]))
+            if len(row) < 3 or row[0] == 'timestamp':
+                continue
+            try:
+                yield row[0], row[1], float(row[2])
+            except ValueError:
+                print(f"Skipping malformed bar: {line.strip()}")
+
+def run_alerts(path, follow=False, file_name='indicators_intraday.json'):
+    state = load_state(file_name)
+    try:
+        for timestamp, ticker, close in read_bar_stream(path, follow=follow):
+            event = update_bar(state, ticker, timestamp, close)
+            if event and event['golden_cross']:
+                print(f"{timestamp} {ticker}: Golden Cross at {close:.2f}")
+            elif event and event['death_cross']:
+                print(f"{timestamp} {ticker}: Death Cross at {close:.2f}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        save_state(state, file_name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a bar stream and print moving average cross alerts")
+    parser.add_argument('path', help="CSV file of timestamp,ticker,close rows")
+    parser.add_argument('--follow', action='store_true', help="Keep reading bars appended to the file")
+    parser.add_argument('--state', default='indicators_intraday.json', help="State file for this stream")
+    args = parser.parse_args()
+    run_alerts(args.path, follow=args.follow, file_name=args.state)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import yfinance as yf
+import tracing
+from price_store import columns, plan_update, commit_update, merge_prices, compact, ticker_frame, window, split_rebases
+
+def date_window(years_back=5):
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=365 * years_back)
+    return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+def download(tickers, start_date, end_date):
+    # Close is kept unadjusted for dividends, and split-adjusted as Yahoo serves it
+    with tracing.span('fetch', host='yfinance', items=len(tickers)) as span:
+        fetched = yf.download(tickers, start=start_date, end=end_date, actions=True, auto_adjust=False,
+                              group_by='ticker', threads=True, progress=False)
+        span['bytes'] = int(fetched.memory_usage().sum())
+    return fetched
+
+def fetch_market_data(tickers, years_back=5):
+    start_date, end_date = date_window(years_back)
+
+    # Work out what each ticker is missing and group tickers that need the same range
+    plans = {}
+    range_groups = {}
+    for ticker in tickers:
+        stored, meta, ranges = plan_update(ticker, start_date, end_date)
+        plans[ticker] = (stored, meta)
+        for date_range in ranges:
+            range_groups.setdefault(date_range, []).append(ticker)
+
+    # One multi-ticker call per missing range, covering prices and dividends together
+    updated = set()
+    covered = {}
+    rebuild = set()
+    for (range_start, range_end), group in range_groups.items():
+        fetched = download(group, range_start, range_end)
+        for ticker in group:
+            stored, meta = plans[ticker]
+            frame = compact(ticker_frame(fetched, ticker))
+            if frame.empty:
+                continue
+            covered[ticker] = min(range_start, covered.get(ticker, range_start))
+            if split_rebases(stored, frame):
+                rebuild.add(ticker)
+            plans[ticker] = (merge_prices(stored, frame), meta)
+            updated.add(ticker)
+
+    # After a split the stored history is on the old scale, so those tickers' whole
+    # window is downloaded again in place of what was stored
+    if rebuild:
+        fetched = download(sorted(rebuild), start_date, end_date)
+        for ticker in rebuild:
+            frame = compact(ticker_frame(fetched, ticker))
+            if frame.empty:
+                # The store is left as it was, so the split is found and the rebuild retried next run
+                updated.discard(ticker)
+                continue
+            plans[ticker] = (frame, {})
+            covered[ticker] = start_date
+
+    for ticker in updated:
+        stored, meta = plans[ticker]
+        commit_update(ticker, stored, meta, start_date, end_date, covered.get(ticker))
+
+    # Align every ticker on one date index, columns keyed by (field, ticker)
+    frames = {ticker: window(plans[ticker][0], start_date, end_date) for ticker in tickers}
+    data = pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+    return data.reindex(columns=pd.MultiIndex.from_product([columns, tickers]))
@@ -0,0 +1,54 @@
+import numpy as np
+
+def to_matrix(close):
+    # Dates x tickers frame to a (tickers x days) float64 array
+    return close.to_numpy(dtype=np.float64).T
+
+def pack_rows(matrix):
+    # Move each row's valid values to the front, in date order, so rolling windows
+    # count a ticker's own trading days rather than days on the shared calendar
+    valid = ~np.isnan(matrix)
+    order = np.argsort(~valid, axis=1, kind='stable')
+    packed = np.take_along_axis(matrix, order, axis=1)
+    counts = valid.sum(axis=1)
+    return packed, order, counts
+
+def valid_mask(packed, counts):
+    return np.arange(packed.shape[1]) < counts[:, None]
+
+def unpack_rows(packed, order, counts):
+    # Inverse of pack_rows, leaving NaN wherever the ticker had no value
+    values = np.where(valid_mask(packed, counts), packed, np.nan)
+    matrix = np.full(packed.shape, np.nan)
+    np.put_along_axis(matrix, order, values, axis=1)
+    return matrix
+
+def row_centre(packed, counts):
+    totals = np.where(valid_mask(packed, counts), packed, 0.0).sum(axis=1)
+    return (totals / np.maximum(counts, 1))[:, None]
+
+def window_sums(cumulative, window):
+    # Sum of each trailing window from a cumulative sum, NaN until the window is full
+    sums = np.full(cumulative.shape, np.nan)
+    if window > cumulative.shape[1]:
+        return sums
+    sums[:, window - 1] = cumulative[:, window - 1]
+    sums[:, window:] = cumulative[:, window:] - cumulative[:, :-window]
+    return sums
+
+def rolling_mean(packed, counts, window):
+    # O(N) rolling mean per row via cumulative sums of centred values
+    centre = row_centre(packed, counts)
+    centred = np.where(valid_mask(packed, counts), packed - centre, 0.0)
+    return window_sums(np.cumsum(centred, axis=1), window) / window + centre
+
+def rolling_mean_std(packed, counts, window):
+    # Rolling mean and population standard deviation in O(N). Values are centred on
+    # each row's mean first so the sum of squares does not lose precision to cancellation
+    centre = row_centre(packed, counts)
+    centred = np.where(valid_mask(packed, counts), packed - centre, 0.0)
+    sums = window_sums(np.cumsum(centred, axis=1), window)
+    squares = window_sums(np.cumsum(centred * centred, axis=1), window)
+    mean = sums / window
+    variance = np.maximum(squares / window - mean * mean, 0.0)
+    return mean + centre, np.sqrt(variance)
@@ -0,0 +1,143 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Directory holding one folder of column arrays per ticker
+store_dir = "price_data"
+
+# Only the columns the stock pipeline reads, stored as float32. Splits are kept so a
+# split that re-bases the Close history can be spotted
+columns = ['Close', 'Dividends', 'Stock Splits']
+value_dtype = np.float32
+
+def ticker_dir(ticker):
+    return os.path.join(store_dir, ticker.replace('/', '_'))
+
+def empty_frame():
+    index = pd.DatetimeIndex([], name='Date')
+    return pd.DataFrame({column: np.array([], dtype=value_dtype) for column in columns}, index=index)
+
+def load_meta(ticker):
+    try:
+        with open(os.path.join(ticker_dir(ticker), 'meta.json'), 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def load_prices(ticker):
+    path = ticker_dir(ticker)
+    date_path = os.path.join(path, 'date.npy')
+    if not os.path.exists(date_path):
+        return empty_frame()
+
+    # Memory-map the arrays so only the requested window is paged in
+    dates = np.load(date_path, mmap_mode='r')
+    data = {}
+    for column in columns:
+        column_path = os.path.join(path, f'{column}.npy')
+        if os.path.exists(column_path):
+            data[column] = np.load(column_path, mmap_mode='r')
+        else:
+            data[column] = np.full(len(dates), np.nan, dtype=value_dtype)
+    return pd.DataFrame(data, index=pd.DatetimeIndex(dates.astype('datetime64[ns]'), name='Date'))
+
+def save_array(path, array):
+    # Write to a temporary file first so a crash never leaves a half-written column
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+def save_prices(ticker, frame, meta):
+    path = ticker_dir(ticker)
+    os.makedirs(path, exist_ok=True)
+    for column in columns:
+        save_array(os.path.join(path, f'{column}.npy'), frame[column].to_numpy(dtype=value_dtype))
+    save_array(os.path.join(path, 'date.npy'), frame.index.values.astype('datetime64[D]'))
+    with open(os.path.join(path, 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+
+def missing_ranges(meta, start_date, end_date, first_date=None, last_date=None):
+    # Date ranges (start inclusive, end exclusive) that have never been requested
+    if not meta:
+        return [(start_date, end_date)]
+    ranges = []
+    if start_date < meta['start']:
+        # The backfill overlaps the first stored bar, so a download that worked always
+        # returns a row and an empty one can be told apart as a failure
+        head_end = meta['start']
+        if first_date is not None:
+            head_end = max(head_end, (first_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+        ranges.append((start_date, head_end))
+    # Resume from the day after the last stored bar so a failed fetch is retried next run
+    tail_start = meta['end']
+    if last_date is not None:
+        tail_start = min(tail_start, (last_date + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    if end_date > tail_start:
+        ranges.append((tail_start, end_date))
+    return ranges
+
+def ticker_frame(fetched, ticker):
+    # yf.download nests columns by ticker for multi-ticker (and newer single-ticker) calls
+    if not isinstance(fetched.columns, pd.MultiIndex):
+        return fetched
+    if ticker in fetched.columns.get_level_values(0):
+        return fetched[ticker]
+    if ticker in fetched.columns.get_level_values(1):
+        return fetched.xs(ticker, axis=1, level=1)
+    return fetched.iloc[:, :0]
+
+def compact(frame):
+    # Keep only the stored columns, as float32, in date order without duplicates
+    frame = frame.reindex(columns=columns).astype(value_dtype)
+    # Tickers without corporate actions (e.g. crypto) get no Dividends or Stock Splits column
+    frame[['Dividends', 'Stock Splits']] = frame[['Dividends', 'Stock Splits']].fillna(0)
+    frame = frame.dropna(subset=['Close'])
+    frame.index = pd.DatetimeIndex(frame.index).tz_localize(None).normalize()
+    frame.index.name = 'Date'
+    return frame[~frame.index.duplicated(keep='last')].sort_index()
+
+def split_rebases(stored, fetched):
+    # Yahoo re-scales the whole Close history after a split, so a split newer than the
+    # first stored row leaves the stored rows on the old scale
+    if stored.empty or fetched.empty:
+        return False
+    split_dates = fetched.index[fetched['Stock Splits'] > 0]
+    return bool(len(split_dates)) and split_dates.max() > stored.index[0]
+
+def merge_prices(stored, fetched):
+    if stored.empty:
+        return fetched
+    if fetched.empty:
+        return stored
+    # Newly fetched rows win over stored rows for the same date
+    frame = pd.concat([stored[~stored.index.isin(fetched.index)], fetched])
+    return frame.sort_index()
+
+def plan_update(ticker, start_date, end_date):
+    # start_date/end_date are 'YYYY-MM-DD' strings, end exclusive like yf.download
+    stored = load_prices(ticker)
+    meta = load_meta(ticker)
+    # An empty store means earlier fetches failed, and a column change means the
+    # stored rows are incomplete, so request everything again in both cases
+    if stored.empty or meta.get('columns') != columns:
+        meta = {}
+    first_date = stored.index[0] if not stored.empty else None
+    last_date = stored.index[-1] if not stored.empty else None
+    return stored, meta, missing_ranges(meta, start_date, end_date, first_date, last_date)
+
+def commit_update(ticker, frame, meta, start_date, end_date, covered_from=None):
+    # covered_from is the earliest requested start whose download returned rows. The
+    # ticker has no earlier data (it listed later), so that range isn't asked for again.
+    # A download that failed covers nothing, and is retried next run
+    first_date = frame.index[0].strftime('%Y-%m-%d') if not frame.empty else start_date
+    meta = {
+        'start': min(first_date, meta.get('start', first_date), covered_from or first_date),
+        'end': max(end_date, meta.get('end', end_date)),
+        'columns': columns,
+    }
+    save_prices(ticker, frame, meta)
+
+def window(frame, start_date, end_date):
+    return frame.loc[(frame.index >= start_date) & (frame.index < end_date)]
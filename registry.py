@@ -0,0 +1,70 @@
+import importlib
+import os
+import re
+import subprocess
+import sys
+import time
+import settings
+
+# Report modules the status email can include, as name: (module, function). Nothing
+# is imported until a module is actually run, so running one module only pays for its
+# own dependencies
+available = {
+    'fuel': ('fuelwatch', 'generate_fuel_content'),
+    'github': ('github', 'get_status_updates'),
+    'ebay': ('ebay', 'get_ebay_results'),
+    'huggingface': ('huggingface', 'scrape_huggingface_models'),
+    'steam': ('steam_wishlist', 'get_tracked_games_html'),
+    'tcbscans': ('tcbscans', 'get_newest_chapter_info'),
+}
+
+# Seconds each module took to import in this process, the first time it was loaded
+import_times = {}
+
+def registered():
+    # Built-in modules plus any declared in [modules.plugins] as name = "module:function"
+    plugins = settings.section('modules').get('plugins', {})
+    return {**available, **{name: tuple(target.split(':', 1)) for name, target in plugins.items()}}
+
+def enabled():
+    # Modules in the status email, in order
+    return settings.section('modules').get('enabled', list(registered()))
+
+def load(name):
+    module_name, function_name = registered()[name]
+    loaded = module_name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if not loaded:
+        import_times[name] = time.perf_counter() - start
+    return getattr(module, function_name)
+
+def import_profile(name):
+    # Import one module in a fresh interpreter under -X importtime and return its total
+    # import time and the slowest top-level imports, in milliseconds
+    env = {**os.environ, 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))}
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import registry; registry.load({name!r})'],
+                             capture_output=True, text=True, env=env)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    imports = []
+    for line in process.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        # Top-level imports are the ones without indentation
+        if match and len(match.group(3)) == 1:
+            imports.append((int(match.group(2)) / 1000, match.group(4)))
+    return sum(ms for ms, _ in imports), sorted(imports, reverse=True)
+
+def print_profile(names, top=5):
+    for name in names:
+        try:
+            total, imports = import_profile(name)
+        except RuntimeError as e:
+            print(f"{name:<12} failed: {e}")
+            continue
+        slowest = ", ".join(f"{module} {ms:.0f}" for ms, module in imports[:top])
+        print(f"{name:<12}{total:>8.0f} ms  {slowest}")
+
+if __name__ == "__main__":
+    # python registry.py [module ...] prints what importing each module costs
+    print_profile(sys.argv[1:] or list(registered()))
@@ -0,0 +1,138 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from analytics import ticker_view
+from chart_assets import save_figure
+from decimate import decimation_indices
+
+# Pages rendered by one worker process before it is replaced, bounding its memory
+tasks_per_worker = 4
+
+# Page geometry, also used to size point decimation to the subplot's pixel width
+page_width = 15
+page_dpi = 100
+line_columns = ['Close', 'Trend', 'Short_MA', 'Long_MA', 'Upper_Band', 'Lower_Band']
+
+# Encoded size targets for each chart page and each per-ticker thumbnail
+default_encoding = {'format': 'png', 'page_budget': 400_000, 'thumbnail_budget': 12_000}
+thumbnail_size = (3, 1)
+
+def ticker_payload(analytics, ticker, ncols=3, decimation='minmax'):
+    # Only the arrays a subplot draws, in compact dtypes, so pages pickle cheaply to workers
+    data = ticker_view(analytics, ticker)
+    summary = analytics['summary']
+    series = {column: data[column].to_numpy(dtype=np.float32) for column in line_columns}
+    golden_crosses = data['Golden_Cross'].to_numpy(dtype=bool)
+    death_crosses = data['Death_Cross'].to_numpy(dtype=bool)
+
+    # Drop points the subplot has no pixels for, keeping crosses and extremes exactly
+    keep = slice(None)
+    if decimation:
+        keep = decimation_indices(series, page_width * page_dpi / ncols,
+                                  preserve=(golden_crosses, death_crosses),
+                                  envelope=('Close', 'Upper_Band', 'Lower_Band'), method=decimation)
+
+    payload = {
+        'ticker': ticker,
+        'dates': data.index.values.astype('datetime64[D]')[keep],
+        'golden_cross': golden_crosses[keep],
+        'death_cross': death_crosses[keep],
+        'cagr': summary.at[ticker, 'cagr'],
+        'average_yield': summary.at[ticker, 'average_yield'],
+    }
+    for column, values in series.items():
+        payload[column] = values[keep]
+    return payload
+
+def plot_ticker(ax, payload, y_min=None):
+    dates = payload['dates']
+    golden_crosses = payload['golden_cross']
+    death_crosses = payload['death_cross']
+    ax.plot(dates, payload['Trend'], "r--", label='Trend Line')
+    ax.plot(dates, payload['Close'], label='Close Price', color='blue', alpha=0.6)
+    ax.plot(dates, payload['Short_MA'], label='50-day MA', color='black', alpha=0.6)
+    ax.plot(dates, payload['Long_MA'], label='200-day MA', color='magenta', alpha=0.6)
+    ax.fill_between(dates, payload['Lower_Band'], payload['Upper_Band'], color='grey', alpha=0.2, label='Bollinger Bands')
+    ax.scatter(dates[golden_crosses], payload['Short_MA'][golden_crosses], color='gold', label='Golden Cross', marker='^', zorder=5)
+    ax.scatter(dates[death_crosses], payload['Short_MA'][death_crosses], color='darkred', label='Death Cross', marker='v', zorder=5)
+    ax.set_title(f"{payload['ticker']}\nYoY Growth: {payload['cagr']:.2f}%, Avg Div Yield: {payload['average_yield']:.2f}%")
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Price')
+    ax.legend()
+    if y_min is not None:
+        ax.set_ylim(bottom=y_min)
+
+def render_thumbnail(payload, save_path, encoding):
+    # Sparkline of the close inside its bands, for the ticker's line in the email body
+    fig = plt.figure(figsize=thumbnail_size, dpi=page_dpi)
+    try:
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.fill_between(payload['dates'], payload['Lower_Band'], payload['Upper_Band'], color='grey', alpha=0.2, linewidth=0)
+        ax.plot(payload['dates'], payload['Close'], color='blue', linewidth=1)
+        ax.set_axis_off()
+        save_figure(fig, save_path, encoding['thumbnail_budget'], encoding['format'], page_dpi)
+    finally:
+        plt.close(fig)
+    return save_path
+
+def render_page(payloads, save_path, ncols=3, y_min=None, thumbnail_paths=None, encoding=None):
+    encoding = encoding or default_encoding
+    nrows = math.ceil(len(payloads) / ncols)
+    fig = plt.figure(figsize=(page_width, 5 * nrows), dpi=page_dpi)
+    try:
+        for i, payload in enumerate(payloads):
+            plot_ticker(fig.add_subplot(nrows, ncols, i + 1), payload, y_min=y_min)
+        fig.tight_layout()
+        # Palette-quantised and shrunk until the page fits its byte budget
+        save_figure(fig, save_path, encoding['page_budget'], encoding['format'], page_dpi)
+    finally:
+        # Release the figure straight away so a long-lived worker does not accumulate them
+        plt.close(fig)
+    for payload, path in zip(payloads, thumbnail_paths or []):
+        render_thumbnail(payload, path, encoding)
+    return save_path
+
+def page_paths(output_dir, file_prefix, page_count, extension='png'):
+    if page_count == 1:
+        return [os.path.join(output_dir, f"{file_prefix}.{extension}")]
+    return [os.path.join(output_dir, f"{file_prefix}_{page + 1}.{extension}") for page in range(page_count)]
+
+def thumbnail_path(output_dir, file_prefix, ticker, extension='png'):
+    return os.path.join(output_dir, f"{file_prefix}_{ticker}_thumb.{extension}")
+
+def render_report(analytics, tickers, output_dir, file_prefix, y_min=None, per_page=6, ncols=3, max_workers=None,
+                  decimation='minmax', thumbnails=False, encoding=None):
+    # Returns the page paths; with thumbnails=True also a dict of ticker -> thumbnail path
+    encoding = {**default_encoding, **(encoding or {})}
+    os.makedirs(output_dir, exist_ok=True)
+    pages = [tickers[i:i + per_page] for i in range(0, len(tickers), per_page)]
+    paths = page_paths(output_dir, file_prefix, len(pages), encoding['format'])
+    thumbnail_paths = {ticker: thumbnail_path(output_dir, file_prefix, ticker, encoding['format']) for ticker in tickers}
+    page_thumbnails = [[thumbnail_paths[ticker] for ticker in page] if thumbnails else None for page in pages]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pages)))
+
+    # A single page is drawn in-process rather than paying for a worker start
+    if max_workers == 1:
+        for page, path, page_thumbnail_paths in zip(pages, paths, page_thumbnails):
+            render_page([ticker_payload(analytics, ticker, ncols, decimation) for ticker in page], path, ncols=ncols, y_min=y_min,
+                        thumbnail_paths=page_thumbnail_paths, encoding=encoding)
+        return (paths, thumbnail_paths) if thumbnails else paths
+
+    with ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=tasks_per_worker) as executor:
+        # Payloads are built as pages are submitted, and at most one round of pages
+        # per worker is in flight so memory stays bounded for very long watchlists
+        futures = []
+        for page, path, page_thumbnail_paths in zip(pages, paths, page_thumbnails):
+            if len(futures) >= max_workers:
+                futures.pop(0).result()
+            payloads = [ticker_payload(analytics, ticker, ncols, decimation) for ticker in page]
+            futures.append(executor.submit(render_page, payloads, path, ncols, y_min, page_thumbnail_paths, encoding))
+        for future in futures:
+            future.result()
+    return (paths, thumbnail_paths) if thumbnails else paths
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import json
+import os
+import pickle
+import pandas as pd
+import requests
+from requests.structures import CaseInsensitiveDict
+import yfinance as yf
+import http_client
+from price_store import ticker_frame
+
+# Record live HTTP and yfinance responses into fixture files, or serve them back
+# so every module can run with no network. All HTTP goes through http_client.perform_request
+# and all market data through yf.download, so those are the two functions swapped out
+
+fixture_dir = "fixtures"
+
+class FixtureMissing(requests.ConnectionError):
+    pass
+
+_live_request = http_client.perform_request
+_live_download = yf.download
+
+def request_key(method, url, params=None, json=None, data=None):
+    payload = {'method': method, 'url': url, 'params': sorted((params or {}).items()), 'json': json, 'data': data}
+    return hashlib.sha1(repr(payload).encode()).hexdigest()
+
+def download_key(ticker, kwargs):
+    # One fixture per ticker, whatever group it was downloaded in. Dates are left out
+    # of the key so fixtures keep working on later days; replayed frames are cut to
+    # the requested window instead
+    options = {key: value for key, value in kwargs.items() if key not in ('start', 'end', 'progress', 'threads', 'group_by')}
+    return hashlib.sha1(repr((ticker, sorted(options.items()))).encode()).hexdigest()
+
+def fixture_path(kind, key, suffix):
+    return os.path.join(fixture_dir, kind, f"{key}.{suffix}")
+
+def save_response(path, url, response):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({
+            'url': url,
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'encoding': response.encoding,
+            'body': base64.b64encode(response.content).decode(),
+        }, file)
+
+def load_response(path):
+    with open(path, 'r') as file:
+        fixture = json.load(file)
+    response = requests.Response()
+    response.status_code = fixture['status_code']
+    response.headers = CaseInsensitiveDict(fixture['headers'])
+    response.encoding = fixture['encoding']
+    response.url = fixture['url']
+    response._content = base64.b64decode(fixture['body'])
+    return response
+
+def recording_request(method, url, **kwargs):
+    response = _live_request(method, url, **kwargs)
+    key = request_key(method, url, kwargs.get('params'), kwargs.get('json'), kwargs.get('data'))
+    save_response(fixture_path('http', key, 'json'), url, response)
+    return response
+
+def replaying_request(method, url, **kwargs):
+    key = request_key(method, url, kwargs.get('params'), kwargs.get('json'), kwargs.get('data'))
+    path = fixture_path('http', key, 'json')
+    if not os.path.exists(path):
+        raise FixtureMissing(f"No fixture for {method} {url} {kwargs.get('params') or ''}")
+    return load_response(path)
+
+def load_frame(path):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+def recording_download(tickers, **kwargs):
+    fetched = _live_download(tickers, **kwargs)
+    for ticker in ([tickers] if isinstance(tickers, str) else tickers):
+        frame = ticker_frame(fetched, ticker)
+        path = fixture_path('yfinance', download_key(ticker, kwargs), 'pkl')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Later incremental downloads add rows to what was recorded before
+        if os.path.exists(path):
+            previous = load_frame(path)
+            frame = pd.concat([previous[~previous.index.isin(frame.index)], frame]).sort_index()
+        with open(path, 'wb') as file:
+            pickle.dump(frame, file)
+    return fetched
+
+def replaying_download(tickers, **kwargs):
+    frames = {}
+    for ticker in ([tickers] if isinstance(tickers, str) else tickers):
+        path = fixture_path('yfinance', download_key(ticker, kwargs), 'pkl')
+        if not os.path.exists(path):
+            raise FixtureMissing(f"No yfinance fixture for {ticker}")
+        frame = load_frame(path)
+        dates = frame.index.tz_localize(None) if frame.index.tz is not None else frame.index
+        keep = (dates >= kwargs.get('start', dates.min())) & (dates < kwargs.get('end', dates.max()))
+        frames[ticker] = frame[keep]
+    # A single ticker string gets flat columns, a list gets (ticker, field) columns
+    if isinstance(tickers, str):
+        return frames[tickers]
+    return pd.concat(frames, axis=1)
+
+def enable(mode, directory=None):
+    # mode is "record" or "replay"; anything else restores the live functions
+    global fixture_dir
+    if directory:
+        fixture_dir = os.path.abspath(directory)
+    if mode == 'record':
+        http_client.perform_request = recording_request
+        yf.download = recording_download
+    elif mode == 'replay':
+        http_client.perform_request = replaying_request
+        yf.download = replaying_download
+    else:
+        http_client.perform_request = _live_request
+        yf.download = _live_download
+
+# REPLAY_MODE=record|replay turns the harness on for any entry point that imports it
+if os.environ.get('REPLAY_MODE'):
+    enable(os.environ['REPLAY_MODE'], os.environ.get('REPLAY_FIXTURES'))
+
+if __name__ == "__main__":
+    # e.g. python replay.py replay stock.py --smtp-sink
+    import argparse
+    import runpy
+    import sys
+    parser = argparse.ArgumentParser(description="Run a report script with recorded or replayed network traffic")
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('script', help="Script to run, e.g. stock.py or status_updates.py")
+    parser.add_argument('--fixtures', default=fixture_dir)
+    parser.add_argument('--smtp-sink', action='store_true', help="Deliver email to a local stand-in SMTP server")
+    args = parser.parse_args()
+
+    enable(args.mode, args.fixtures)
+    if args.smtp_sink:
+        import send_email
+        import smtp_sink
+        sink = smtp_sink.start_sink()
+        send_email.smtp_host, send_email.smtp_port, send_email.smtp_starttls = '127.0.0.1', sink.port, False
+    sys.argv = [args.script]
+    runpy.run_path(args.script, run_name='__main__')
+    if args.smtp_sink:
+        print(f"SMTP sink received {len(sink.messages)} message(s)")
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytz
+import settings
+import registry
+import state_store
+import tracing
+
+# Resident replacement for running stock.py and status_updates.py from cron. The
+# report modules are imported once and stay loaded, and each job runs on its own
+# cadence. A job that is still running is never started a second time.
+#
+#   python scheduler.py                 # run the daemon
+#   python scheduler.py status          # ask the daemon what it's doing
+#   python scheduler.py run fuel        # trigger a job now
+#   python scheduler.py once stock      # run a job in this process, no daemon needed
+
+config = settings.section('scheduler')
+
+control_host = '127.0.0.1'
+control_port = config.get('control_port', 8765)
+default_timezone = config.get('timezone', 'Australia/Perth')
+
+# A job runs a whole report ("stock", "status", or "outbox" to retry queued mail) or a
+# list of status modules, either at fixed local times ("at", optionally on "days") or
+# "every" so many seconds. email = "changed" only sends a module job when its run found
+# something new, or for modules that don't report that, when its content changed
+default_jobs = {
+    'stock': {'report': 'stock', 'at': '16:30', 'days': ['mon', 'tue', 'wed', 'thu', 'fri'], 'timezone': 'Australia/Sydney'},
+    'status': {'report': 'status', 'at': '07:00'},
+    'fuel': {'modules': ['fuel'], 'at': '14:30'},
+    'github': {'modules': ['github'], 'every': 3600, 'email': 'changed'},
+    'outbox': {'report': 'outbox', 'every': 900},
+}
+jobs = config.get('jobs', default_jobs)
+
+job_state = {name: {'lock': threading.Lock(), 'next_run': None, 'last_start': None, 'last_duration': None,
+                    'last_result': None, 'runs': 0} for name in jobs}
+
+def next_run(job, after):
+    if 'every' in job:
+        # Aligned to the clock, so an hourly job runs on the hour
+        return (after // job['every'] + 1) * job['every']
+    tz = pytz.timezone(job.get('timezone', default_timezone))
+    local = datetime.fromtimestamp(after, tz)
+    times = [job['at']] if isinstance(job['at'], str) else job['at']
+    days = job.get('days')
+    candidates = []
+    for offset in range(8):
+        day = (local + timedelta(days=offset)).date()
+        if days and day.strftime('%a').lower() not in days:
+            continue
+        for at in times:
+            hour, minute = map(int, at.split(':'))
+            candidates.append(tz.localize(datetime(day.year, day.month, day.day, hour, minute)).timestamp())
+    return min(candidate for candidate in candidates if candidate > after)
+
+def warm_up():
+    # Import the modules the jobs use once at start, rather than on the first run of each job
+    for job in jobs.values():
+        report_module(job.get('report', 'status'))
+        for name in job.get('modules', registry.enabled() if job.get('report') == 'status' else []):
+            registry.load(name)
+
+def report_module(report):
+    if report == 'stock':
+        import stock
+        return stock
+    if report == 'outbox':
+        import send_email
+        return send_email
+    import status_updates
+    return status_updates
+
+def found_changes(name, job, run, sections):
+    # Modules report what their own run found new (tracing.found_new), which other jobs
+    # updating the same state can't affect. A job with a module that reported nothing,
+    # e.g. a plugin or a failed run, falls back to comparing its content with the last sent
+    new = run.get('new', {})
+    if all(module in new for module in job['modules']):
+        return any(new[module] for module in job['modules'])
+    digest = hashlib.sha1(sections.encode()).hexdigest()
+    if state_store.get_value('scheduler', name) == digest:
+        return False
+    state_store.set_value('scheduler', name, digest)
+    return True
+
+def run_modules(name, job):
+    status_updates = report_module('status')
+    subject = f"{status_updates.report_subject()} - {', '.join(job['modules'])}"
+    with tracing.report_run(name) as run:
+        sections = status_updates.modules_run(job['modules'])
+        if job.get('email') == 'changed' and not found_changes(name, job, run, sections):
+            return 'unchanged, not sent'
+        sections += status_updates.timing_section()
+        status_updates.send_email_with_attachment(subject, status_updates.sender_email, status_updates.receiver_email,
+                                                  status_updates.password, status_updates.email_template(subject, sections))
+    return 'sent'
+
+def run_report(name, job):
+    if 'modules' in job:
+        return run_modules(name, job)
+    module = report_module(job['report'])
+    if job['report'] == 'outbox':
+        email_config = settings.section('email')
+        return f"{len(module.flush_outbox(email_config['sender_email'], email_config['password']))} sent"
+    return 'sent' if module.send_report() else 'queued'
+
+def run_job(name):
+    state = job_state[name]
+    start = time.time()
+    state['last_start'] = start
+    try:
+        state['last_result'] = run_report(name, jobs[name])
+    except Exception as e:
+        traceback.print_exc()
+        state['last_result'] = f"failed: {type(e).__name__}: {e}"
+    finally:
+        state['last_duration'] = time.time() - start
+        state['runs'] += 1
+        state['lock'].release()
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {name}: {state['last_result']} in {state['last_duration']:.1f}s")
+
+def start_job(name):
+    # Overlap protection: a job still running from its last start is skipped
+    if not job_state[name]['lock'].acquire(blocking=False):
+        print(f"{name} is still running, skipped")
+        return False
+    threading.Thread(target=run_job, args=(name,), name=f"job-{name}", daemon=True).start()
+    return True
+
+def status():
+    return {name: {
+        'running': state['lock'].locked(),
+        'next_run': datetime.fromtimestamp(state['next_run']).isoformat(timespec='seconds') if state['next_run'] else None,
+        'last_start': datetime.fromtimestamp(state['last_start']).isoformat(timespec='seconds') if state['last_start'] else None,
+        'last_duration': state['last_duration'],
+        'last_result': state['last_result'],
+        'runs': state['runs'],
+    } for name, state in job_state.items()}
+
+class ControlHandler(BaseHTTPRequestHandler):
+    # GET /status, POST /run/<job>
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.reply(200, status())
+        else:
+            self.reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'run':
+            self.reply(404, {'error': 'not found'})
+        elif parts[1] not in jobs:
+            self.reply(404, {'error': f"unknown job {parts[1]}"})
+        elif start_job(parts[1]):
+            self.reply(202, {'started': parts[1]})
+        else:
+            self.reply(409, {'error': f"{parts[1]} is already running"})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve():
+    # Binding the control port also stops a second daemon from starting
+    try:
+        server = ThreadingHTTPServer((control_host, control_port), ControlHandler)
+    except OSError:
+        print(f"A scheduler is already running on port {control_port}")
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    warm_up()
+
+    now = time.time()
+    for name, job in jobs.items():
+        job_state[name]['next_run'] = next_run(job, now)
+    print(f"Scheduler running, control on http://{control_host}:{control_port}")
+
+    try:
+        while True:
+            now = time.time()
+            for name, job in jobs.items():
+                state = job_state[name]
+                if state['next_run'] <= now:
+                    start_job(name)
+                    state['next_run'] = next_run(job, now)
+            # Wake at least once a minute so clock changes and suspends are caught up on
+            time.sleep(min(60, max(0, min(state['next_run'] for state in job_state.values()) - time.time())))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def control(method, path):
+    request = urllib.request.Request(f"http://{control_host}:{control_port}{path}", method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'serve'
+    if command == 'serve':
+        serve()
+    elif command == 'status':
+        print(json.dumps(control('GET', '/status'), indent=2))
+    elif command == 'run':
+        print(json.dumps(control('POST', f'/run/{sys.argv[2]}')))
+    elif command == 'once':
+        job_state[sys.argv[2]]['lock'].acquire()
+        run_job(sys.argv[2])
+    else:
+        print("Usage: python scheduler.py [serve | status | run <job> | once <job>]")
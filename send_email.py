@@ -1,34 +1,227 @@
+import atexit
 import os
+import random
+import re
 import smtplib
+import threading
+import time
+import uuid
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
+from email.mime.image import MIMEImage
 from email import encoders
+import state_store
+import tracing
 
-def send_email_with_attachment(subject, sender_email, receiver_email, password, email_body, attachment_path=None):
+# SMTP server settings; the replay harness points these at a local stand-in server
+smtp_host = 'smtp.gmail.com'
+smtp_port = 587
+smtp_starttls = True
+smtp_timeout = 60
+
+# Messages wait in the 'outbox' collection of the state store until the server
+# accepts them. A failed message is retried on later flushes with exponential
+# backoff. After max_attempts, or when the server rejects it outright, it is moved
+# to the 'outbox_dead' collection
+max_attempts = 10
+retry_base = 60
+retry_max = 6 * 3600
+
+# One authenticated connection per (host, port, sender), reused across messages
+_connections = {}
+_lock = threading.RLock()
+
+def recipients(email_config):
+    # receiver_email plus additional_email from settings.toml; either may be a string or a list
+    addresses = []
+    for key in ('receiver_email', 'additional_email'):
+        value = email_config.get(key) or []
+        addresses += [value] if isinstance(value, str) else list(value)
+    return [address for address in addresses if address]
+
+def content_id(path):
+    # Content-ID an inline image is referenced by from the HTML body, as cid:<id>
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.basename(path))
+
+def build_message(subject, sender_email, receiver_email, email_body, attachment_path=None, inline_images=None):
     msg = MIMEMultipart()
     msg['From'] = sender_email
-    msg['To'] = receiver_email
+    msg['To'] = ', '.join(receiver_email)
     msg['Subject'] = subject
 
-    msg.attach(MIMEText(email_body, 'html'))
+    if inline_images:
+        # Images shown in the body travel with it in a multipart/related part, and the
+        # HTML refers to each one as cid:<content_id(path)>
+        related = MIMEMultipart('related')
+        related.attach(MIMEText(email_body, 'html'))
+        for path in inline_images:
+            with open(path, 'rb') as image:
+                part = MIMEImage(image.read(), _subtype=os.path.splitext(path)[1].lstrip('.').lower() or 'png')
+            part.add_header('Content-ID', f'<{content_id(path)}>')
+            part.add_header('Content-Disposition', 'inline', filename=os.path.basename(path))
+            related.attach(part)
+        msg.attach(related)
+    else:
+        msg.attach(MIMEText(email_body, 'html'))
 
-    if attachment_path:
-        with open(attachment_path, 'rb') as attachment:
+    # attachment_path may be a single path or a list of paths
+    if isinstance(attachment_path, str):
+        attachment_path = [attachment_path]
+    for path in attachment_path or []:
+        with open(path, 'rb') as attachment:
             part = MIMEBase('application', 'octet-stream')
             part.set_payload(attachment.read())
             encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
+            part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(path)}')
             msg.attach(part)
+    return msg
 
+def enqueue(msg, sender_email, receiver_email):
+    # Persist the message before any delivery attempt, so a crash can't lose it
+    message_id = f"{time.time():.6f}-{uuid.uuid4().hex[:8]}"
+    state_store.upsert_records('outbox', {message_id: {
+        'sender': sender_email,
+        'recipients': receiver_email,
+        'message': msg.as_string(),
+        'attempts': 0,
+        'next_attempt': 0,
+        'last_error': None,
+    }})
+    return message_id
+
+def connect(sender_email, password):
+    key = (smtp_host, smtp_port, sender_email)
+    server = _connections.get(key)
+    if server is not None:
+        # Check the kept connection is still alive before reusing it
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        disconnect(key)
+
+    server = smtplib.SMTP(smtp_host, smtp_port, timeout=smtp_timeout)
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
+        if smtp_starttls:
+            server.starttls()
         server.login(sender_email, password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
+    except Exception:
+        server.close()
+        raise
+    _connections[key] = server
+    return server
+
+def disconnect(key):
+    server = _connections.pop(key, None)
+    if server is None:
+        return
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+def close_connections():
+    with _lock:
+        for key in list(_connections):
+            disconnect(key)
+
+atexit.register(close_connections)
+
+def retry_delay(attempts):
+    # Full jitter, like the HTTP client, so queued messages don't retry in lockstep
+    return random.uniform(retry_base / 2, min(retry_max, retry_base * 2 ** (attempts - 1)))
+
+def permanent_failure(e):
+    # A 5xx answer to the message itself (not to the login) would only be refused again
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    return isinstance(e, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)) and e.smtp_code >= 500
+
+def dead_letter(message_id, item):
+    # Moved in one transaction, so the message is never in both collections or neither
+    print(f"Giving up on email {message_id} after {item['attempts']} attempt(s): {item['last_error']}")
+    state_store.transaction([state_store.upsert_statement('outbox_dead', {message_id: {**item, 'dead_at': time.time()}}),
+                             state_store.delete_statement('outbox', [message_id])])
+
+def due_messages(now):
+    outbox = state_store.get_records('outbox')
+    due = []
+    for message_id, item in outbox.items():
+        if item['attempts'] >= max_attempts:
+            # Left over from before exhausted messages were moved out
+            dead_letter(message_id, item)
+        elif item['next_attempt'] <= now:
+            due.append((message_id, item))
+    return sorted(due)
+
+def flush_outbox(sender_email, password):
+    # Deliver every due message from this sender over one connection. Returns the ids
+    # that were accepted; the rest stay queued for a later flush
+    sent = []
+    connection_error = None
+    with _lock:
+        for message_id, item in due_messages(time.time()):
+            if item['sender'] != sender_email:
+                continue
+            try:
+                with tracing.span('send', bytes=len(item['message']), items=len(item['recipients'])):
+                    # Once the server can't be reached or refuses the login, the remaining
+                    # messages are failed with the same error instead of reconnecting for each
+                    if connection_error:
+                        raise connection_error
+                    try:
+                        server = connect(sender_email, password)
+                    except (smtplib.SMTPException, OSError) as e:
+                        connection_error = e
+                        raise
+                    server.sendmail(sender_email, item['recipients'], item['message'])
+            except (smtplib.SMTPException, OSError) as e:
+                # Drop the connection; the next message (or flush) reconnects
+                disconnect((smtp_host, smtp_port, sender_email))
+                item['attempts'] += 1
+                item['next_attempt'] = time.time() + retry_delay(item['attempts'])
+                item['last_error'] = f"{type(e).__name__}: {e}"
+                if item['attempts'] >= max_attempts or (not connection_error and permanent_failure(e)):
+                    dead_letter(message_id, item)
+                    continue
+                state_store.upsert_records('outbox', {message_id: item})
+                print(f"Failed to send email (attempt {item['attempts']} of {max_attempts}): {e}")
+                continue
+            state_store.delete_records('outbox', [message_id])
+            sent.append(message_id)
+    return sent
+
+def send_email_with_attachment(subject, sender_email, receiver_email, password, email_body, attachment_path=None,
+                               inline_images=None):
+    # receiver_email may be a single address or a list of addresses
+    if isinstance(receiver_email, str):
+        receiver_email = [receiver_email]
+    msg = build_message(subject, sender_email, receiver_email, email_body, attachment_path, inline_images)
+    message_id = enqueue(msg, sender_email, receiver_email)
+
+    # Older messages that failed earlier go out on the same connection
+    sent = flush_outbox(sender_email, password)
+    if message_id in sent:
         print("Email sent successfully!")
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-    finally:
-        server.quit()
\ No newline at end of file
+        return True
+    if message_id in state_store.get_many('outbox', [message_id]):
+        print("Email queued in the outbox for a later retry")
+    return False
+
+def outbox_status(collection='outbox'):
+    # collection='outbox_dead' lists the messages that were given up on
+    return [(message_id, item['attempts'], item['last_error']) for message_id, item in sorted(state_store.get_records(collection).items())]
+
+if __name__ == "__main__":
+    # python send_email.py retries everything still queued in the outbox
+    import settings
+    email_config = settings.section('email')
+    sent = flush_outbox(email_config['sender_email'], email_config['password'])
+    close_connections()
+    print(f"Sent {len(sent)} queued message(s)")
+    for message_id, attempts, last_error in outbox_status():
+        print(f"{message_id}: {attempts} attempt(s), last error: {last_error}")
+    for message_id, attempts, last_error in outbox_status('outbox_dead'):
+        print(f"{message_id}: given up after {attempts} attempt(s), last error: {last_error}")
@@ -0,0 +1,21 @@
+import toml
+
+# settings.toml is parsed once per process, on first use, and shared by every module
+settings_file = "settings.toml"
+
+_config = None
+
+def load():
+    global _config
+    if _config is None:
+        _config = toml.load(settings_file)
+    return _config
+
+def section(name):
+    return load().get(name, {})
+
+def options(name, defaults):
+    # A section's values over a module's defaults. Modules call this where a setting is
+    # used rather than copying settings into globals; load() is cached, so it's only a
+    # dict merge
+    return {**defaults, **section(name)}
@@ -0,0 +1,101 @@
+import base64
+import socketserver
+import threading
+
+# Local stand-in for the Gmail SMTP server. It accepts any login and keeps every
+# message it receives, so email delivery can be exercised without a network
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.sessions += 1
+        self.reply("220 localhost SMTP sink ready")
+        envelope = {'from': None, 'to': []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.reply("250-localhost")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 8BITMIME")
+            elif verb == 'AUTH':
+                self.authenticate(command)
+            elif verb == 'MAIL':
+                envelope = {'from': command.split(':', 1)[1].strip(), 'to': []}
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                envelope['to'].append(command.split(':', 1)[1].strip())
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.messages.append({**envelope, 'data': self.read_data()})
+                self.server.received.set()
+                self.reply("250 OK: queued")
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def authenticate(self, command):
+        parts = command.split()
+        # AUTH LOGIN sends the username and password on their own lines
+        if len(parts) > 1 and parts[1].upper() == 'LOGIN':
+            if len(parts) < 3:
+                self.reply("334 " + base64.b64encode(b"Username:").decode())
+                self.rfile.readline()
+            self.reply("334 " + base64.b64encode(b"Password:").decode())
+            self.rfile.readline()
+        elif len(parts) == 2:
+            # AUTH PLAIN without an initial response
+            self.reply("334 ")
+            self.rfile.readline()
+        self.reply("235 Authentication successful")
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            # Undo dot-stuffing
+            if line.startswith(b".."):
+                line = line[1:]
+            lines.append(line)
+        return b"".join(lines)
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), SMTPHandler)
+        self.messages = []
+        self.sessions = 0
+        self.received = threading.Event()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+def start_sink(host='127.0.0.1', port=0):
+    # Serve on a background thread; port 0 picks a free port
+    sink = SMTPSink(host, port)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
+
+if __name__ == "__main__":
+    sink = SMTPSink(port=1025)
+    print(f"SMTP sink listening on 127.0.0.1:{sink.port}")
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Received {len(sink.messages)} message(s)")
@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import threading
+import time
+import tracing
+
+# Single SQLite database holding every module's tracking state. WAL mode lets the
+# concurrently running modules read while another one commits
+db_file = 'state.db'
+
+_local = threading.local()
+
+def connection():
+    # sqlite3 connections can't be shared between threads, so each thread opens its own
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'db_file', None) != db_file:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key)) WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS records (collection TEXT, key TEXT, value TEXT, updated_at REAL, '
+                     'PRIMARY KEY (collection, key)) WITHOUT ROWID')
+        _local.conn = conn
+        _local.db_file = db_file
+    return conn
+
+def transaction(statements):
+    # Run (sql, rows) pairs in one transaction, so a crash never leaves half an update
+    tracing.check_deadline('state write')
+    conn = connection()
+    with tracing.span('state', items=sum(len(rows) for _, rows in statements)):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, rows in statements:
+                conn.executemany(sql, rows)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+def get_value(namespace, key, default=None):
+    with tracing.span('state', items=1) as span:
+        row = connection().execute('SELECT value FROM kv WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        span['bytes'] = len(row[0]) if row else 0
+    return json.loads(row[0]) if row else default
+
+def set_value(namespace, key, value):
+    transaction([('INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)',
+                  [(namespace, key, json.dumps(value))])])
+
+def get_record(collection, key, default=None):
+    row = connection().execute('SELECT value FROM records WHERE collection = ? AND key = ?', (collection, key)).fetchone()
+    return json.loads(row[0]) if row else default
+
+def get_records(collection):
+    with tracing.span('state') as span:
+        rows = connection().execute('SELECT key, value FROM records WHERE collection = ?', (collection,)).fetchall()
+        span['items'] = len(rows)
+        span['bytes'] = sum(len(value) for _, value in rows)
+    return {key: json.loads(value) for key, value in rows}
+
+def lookup_rows(collection, keys, fields):
+    # Primary-key lookups for just the given keys, instead of loading the collection
+    keys = list(keys)
+    rows = []
+    conn = connection()
+    with tracing.span('state', items=len(keys)):
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows += conn.execute(f'SELECT {fields} FROM records WHERE collection = ? AND key IN ({placeholders})', [collection, *chunk])
+    return rows
+
+def existing_keys(collection, keys):
+    return {key for (key,) in lookup_rows(collection, keys, 'key')}
+
+def get_many(collection, keys):
+    # Values for just the given keys
+    return {key: json.loads(value) for key, value in lookup_rows(collection, keys, 'key, value')}
+
+def count_records(collection):
+    return connection().execute('SELECT COUNT(*) FROM records WHERE collection = ?', (collection,)).fetchone()[0]
+
+def upsert_statement(collection, records):
+    now = time.time()
+    rows = [(collection, key, json.dumps(value), now) for key, value in records.items()]
+    return ('INSERT OR REPLACE INTO records (collection, key, value, updated_at) VALUES (?, ?, ?, ?)', rows)
+
+def upsert_records(collection, records):
+    transaction([upsert_statement(collection, records)])
+
+def replace_records(collection, records):
+    # Make the collection exactly these records, in one transaction
+    transaction([('DELETE FROM records WHERE collection = ?', [(collection,)]),
+                 upsert_statement(collection, records)])
+
+def delete_stale_records(collection, before):
+    # Drop records last written before the given time; returns how many went
+    tracing.check_deadline('state write')
+    with tracing.span('state'):
+        return connection().execute('DELETE FROM records WHERE collection = ? AND updated_at < ?', (collection, before)).rowcount
+
+def delete_statement(collection, keys):
+    return ('DELETE FROM records WHERE collection = ? AND key = ?', [(collection, key) for key in keys])
+
+def delete_records(collection, keys):
+    transaction([delete_statement(collection, keys)])
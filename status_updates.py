@@ -1,28 +1,42 @@
-from ebay import get_ebay_results
-from github import get_status_updates
-import toml
+import html
+import sys
+import threading
+import time
 from datetime import datetime
-from send_email import send_email_with_attachment
-from steam_wishlist import get_tracked_games_html
-from tcbscans import get_newest_chapter_info
-from fuelwatch import generate_fuel_content
-from huggingface import scrape_huggingface_models
+import registry
+import settings
+import tracing
+from send_email import send_email_with_attachment, recipients
 
 # Load settings from the TOML file
-config = toml.load("settings.toml")
+config = settings.load()
 
 # Email settings
 sender_email = config['email']['sender_email']
-receiver_email = config['email']['receiver_email']
+receiver_email = recipients(config['email'])  # receiver_email plus any additional_email
 password = config['email']['password']
 
-date_now = datetime.now().strftime('%d/%m/%Y')
+# Seconds each report module may take before it is reported as timed out
+module_timeout = config.get('status_updates', {}).get('module_timeout', 60)
 
-subject = date_now + " Update Report"
+# One lock per module, so scheduler jobs that share a module (e.g. the status report and
+# the hourly github job) never run it at the same time
+module_locks = {}
+_module_locks_lock = threading.Lock()
 
+def report_subject():
+    # Worked out per report, since a long-running scheduler sends many
+    return datetime.now().strftime('%d/%m/%Y') + " Update Report"
 
-def create_email_content():
-    
+def create_email_content(names=None, subject=None):
+    subject = subject or report_subject()
+    return email_template(subject, modules_run(names) + timing_section())
+
+def timing_section():
+    footer = tracing.email_footer()
+    return f"<tr><td class='footer'>{footer}</td></tr>" if footer else ""
+
+def email_template(subject, sections):
     email_body = """
     <!DOCTYPE html>
     <html lang="en">
@@ -85,25 +99,77 @@ def create_email_content():
         </table>
     </body>
     </html>
-    """ % (subject, modules_run())
+    """ % (subject, sections)
     return email_body
 
-def modules_run():
-    # List of functions
-    functions = [
-        generate_fuel_content,
-        get_status_updates,
-        get_ebay_results,
-        scrape_huggingface_models,
-        get_tracked_games_html,
-        get_newest_chapter_info
-    ]
-
-    # Generate the HTML for each function and add separators
-    results = [func() for func in functions]
-    html_output = "<tr><td><hr></td></tr>".join(results)
+def modules_run(names=None):
+    # The modules enabled in settings.toml by default, or just the named ones
+    names = names or registry.enabled()
+    run = tracing.current()[0]
+    results = [None] * len(names)
+    loaded = []
+    for i, name in enumerate(names):
+        # Modules are imported here, one at a time, the first time they run
+        try:
+            loaded.append((i, name, registry.load(name)))
+        except Exception as e:
+            print(f"{name} failed to load: {e}")
+            results[i] = (False, e)
+    # A module still running at the deadline is reported as timed out, and its thread
+    # stops before its next request or state write
+    deadline = time.monotonic() + module_timeout
+    # Run every module concurrently, since each one mostly waits on the network.
+    # Daemon threads are used so a hung module can't keep the process alive either
+    threads = [threading.Thread(target=run_module, args=(name, func, results, i, run, deadline), daemon=True)
+               for i, name, func in loaded]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+
+    # Generate the HTML for each module in the original order and add separators
+    sections = [module_section(name, result) for name, result in zip(names, results)]
+    html_output = "<tr><td><hr></td></tr>".join(sections)
 
     return html_output
 
-email_body = create_email_content()
-send_email_with_attachment(subject, sender_email, receiver_email, password, email_body)
+def module_lock(name):
+    with _module_locks_lock:
+        return module_locks.setdefault(name, threading.Lock())
+
+def run_module(name, func, results, index, run=None, deadline=None):
+    # Wait for another job's run of the module to finish, but no longer than this run's deadline
+    lock = module_lock(name)
+    if not lock.acquire(timeout=-1 if deadline is None else max(0, deadline - time.monotonic())):
+        print(f"{name} is still running for another report, skipped")
+        return
+    try:
+        # Everything the module does is traced under its name
+        with tracing.module(name, run, deadline) as span:
+            results[index] = (True, func())
+            span['bytes'] = len(results[index][1] or '')
+    except Exception as e:
+        print(f"{name} failed: {e}")
+        results[index] = (False, e)
+    finally:
+        lock.release()
+
+def module_section(name, result):
+    # A slow or failing module becomes an error section instead of stopping the email
+    if result is None:
+        return f"<tr><td class='content'>{name} timed out after {module_timeout} seconds.</td></tr>"
+    succeeded, value = result
+    if not succeeded:
+        return f"<tr><td class='content'>{name} failed: {html.escape(str(value))}</td></tr>"
+    return value
+
+def send_report(names=None, subject=None):
+    subject = subject or report_subject()
+    # Stages are traced to metrics/ and optionally summarised at the bottom of the email
+    with tracing.report_run('status'):
+        email_body = create_email_content(names, subject)
+        return send_email_with_attachment(subject, sender_email, receiver_email, password, email_body)
+
+if __name__ == "__main__":
+    # python status_updates.py [module ...] sends just those modules, e.g. "fuel"
+    send_report(sys.argv[1:] or None)
@@ -1,33 +1,168 @@
-import requests
-from bs4 import BeautifulSoup
-from track_data import open_json, save_json 
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http_cache import cached_parse
+from html_parse import parse
+import history
+import settings
+import state_store
+import tracing
+from track_data import migrate_records
 
-def fetch_steam_wishlist():
-    url = "https://store.steampowered.com/search/?filter=popularwishlist"
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+# The wishlist ranking is reused for an hour before the page is revalidated
+cache_ttl = 3600
+
+search_url = "https://store.steampowered.com/search/"
+results_url = "https://store.steampowered.com/search/results/"
+
+# [steam] settings and their defaults
+defaults = {
+    # "json" pages through the infinite-scroll results endpoint to track the top_n games;
+    # "html" scrapes the first search page only
+    'mode': 'json',
+    'top_n': 500,
+    # Results per request (Steam returns at most 100) and pages fetched at once
+    'page_size': 100,
+    'max_workers': 4,
+    # Games listed in the email
+    'display_count': 10,
+}
+
+def options():
+    return settings.options('steam', defaults)
+
+def page_size():
+    return min(options()['page_size'], 100)
+
+def game_record(row):
+    # Apps are keyed by appid; bundles and packages have their own id attributes instead
+    for attribute, prefix in (('data-ds-appid', ''), ('data-ds-bundleid', 'bundle:'), ('data-ds-packageid', 'package:')):
+        if row.get(attribute):
+            key = prefix + row[attribute].split(',')[0]
+            break
+    else:
+        key = row['href']
+    return {'key': key, 'title': row.find('span', class_='title').text, 'link': row['href']}
 
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'html.parser')
+def parse_wishlist(response):
+    soup = parse('steam_wishlist', response.content)
 
     games = []
     for game in soup.find_all('a', class_='search_result_row')[:10]:
         title = game.find('span', class_='title').text
         link = game['href']
         games.append({'title': title, 'link': link})
-    
+
     return games
 
-def track_changes(current_games, previous_games):
-    previous_titles = [game['title'] for game in previous_games]
+def parse_results_page(response):
+    # The infinite-scroll endpoint wraps a fragment of result rows in JSON
+    data = json.loads(response.content)
+    soup = parse('steam_wishlist', data.get('results_html', ''))
+    return {'total_count': data.get('total_count', 0),
+            'games': [game_record(row) for row in soup.find_all('a', class_='search_result_row')]}
+
+def fetch_steam_wishlist():
+    url = f"{search_url}?filter=popularwishlist"
+    status_code, games = cached_parse(url, parse_wishlist, ttl=cache_ttl)
+    return games or []
+
+def fetch_results_page(start):
+    params = {'filter': 'popularwishlist', 'start': start, 'count': page_size(), 'infinite': 1}
+    status_code, page = cached_parse(results_url, parse_results_page, params=params, ttl=cache_ttl)
+    if status_code != 200:
+        print(f"Failed to retrieve Steam results from {start}: {status_code}")
+        return None
+    return page['games']
+
+def fetch_ranking():
+    # Returns the ranking keyed by game and whether every page arrived. Pages are
+    # fetched concurrently; http_client still spaces requests to the host
+    config = options()
+    top_n = config['top_n']
+    starts = range(0, top_n, page_size())
+    with ThreadPoolExecutor(max_workers=config['max_workers']) as executor:
+        pages = list(executor.map(tracing.propagate(fetch_results_page), starts))
+
+    # Ranks follow page order. The ranking can shift between page requests, so a game
+    # seen on two pages keeps its first position. Ranks after a failed page are unknown
+    ranking = {}
+    for page in pages:
+        if page is None:
+            return ranking, False
+        for game in page:
+            if game['key'] not in ranking and len(ranking) < top_n:
+                ranking[game['key']] = {**game, 'rank': len(ranking) + 1}
+    return ranking, True
+
+def rank_changes(current, previous):
+    # One pass over each hash index: rank deltas and entries for current games, exits
+    # for previous ones that are gone
+    changes = [(game, previous[key]['rank'] if key in previous else None) for key, game in current.items()]
+    exits = [game for key, game in previous.items() if key not in current]
+    return changes, sorted(exits, key=lambda game: game['rank'])
+
+def track_changes(current_games, previous_titles):
+    # previous_titles is a set, so each membership check is O(1)
     return [(game, game['title'] not in previous_titles) for game in current_games]
 
+def movement(previous_rank, rank):
+    if previous_rank is None:
+        return " (New!)"
+    if previous_rank > rank:
+        return f" (&#9650;{previous_rank - rank})"
+    if previous_rank < rank:
+        return f" (&#9660;{rank - previous_rank})"
+    return ""
+
+def get_ranked_games_html():
+    current, complete = fetch_ranking()
+    if not current:
+        return "<tr><td class='content'><h3>Top Steam Wishlist Games</h3>Failed to retrieve the wishlist ranking.</td></tr>"
+    previous = state_store.get_records('steam_ranks')
+    changes, exits = rank_changes(current, previous)
+
+    history.record('steam', [(game['title'], game['rank']) for game in current.values()])
+    if complete:
+        state_store.replace_records('steam_ranks', current)
+    else:
+        # Games past the missing page may still be ranked, so none are dropped
+        exits = []
+        state_store.upsert_records('steam_ranks', current)
+    # Only games entering the ranking count as new; the first run has nothing to compare against
+    tracing.found_new(sum(previous_rank is None for _, previous_rank in changes) if previous else 0)
+
+    results_output = "<tr><td class='content'>"
+    results_output += "<h3>Top Steam Wishlist Games</h3>"
+    for game, previous_rank in changes[:options()['display_count']]:
+        # The first run has nothing to compare against, so nothing is marked
+        mark = movement(previous_rank, game['rank']) if previous else ""
+        results_output += f"{game['rank']}. <a href='{game['link']}'>{game['title']}</a>{mark}<br><br>"
+
+    if previous:
+        entries = [game for game, previous_rank in changes if previous_rank is None]
+        results_output += f"Top {len(current)}: {len(entries)} new, {len(exits)} dropped out<br>"
+        if entries:
+            results_output += "New: " + ", ".join(f"{game['title']} (#{game['rank']})" for game in entries[:5]) + "<br>"
+        if exits:
+            results_output += "Dropped out: " + ", ".join(f"{game['title']} (was #{game['rank']})" for game in exits[:5]) + "<br>"
+    results_output += "</td></tr>"
+    return results_output
+
 def get_tracked_games_html():
+    if options()['mode'] == 'json':
+        return get_ranked_games_html()
+
     json_file_path = 'steam_wishlist.json'
-    previous_games = open_json(json_file_path)  # Using open_json from track_data
+    migrate_records('steam_wishlist', json_file_path, 'title')  # Import the legacy JSON state once
     current_games = fetch_steam_wishlist()
-    tracked_games = track_changes(current_games, previous_games)
+    if not current_games:
+        # A failed or empty fetch leaves the stored wishlist as it was
+        return "<tr><td class='content'><h3>Top Steam Wishlist Games</h3>Failed to retrieve the wishlist.</td></tr>"
+    previous_titles = state_store.existing_keys('steam_wishlist', [game['title'] for game in current_games])
+    tracked_games = track_changes(current_games, previous_titles)
 
-    save_json(json_file_path, current_games)  # Using save_json from track_data
+    history.record('steam', [(game['title'], rank) for rank, game in enumerate(current_games, start=1)])
+    state_store.replace_records('steam_wishlist', {game['title']: game for game in current_games})
 
     results_output = "<tr><td class='content'>"
     results_output += "<h3>Top Steam Wishlist Games</h3>"
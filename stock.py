@@ -1,108 +1,110 @@
-import numpy as np
-from datetime import datetime, timedelta
-import pytz
-import yfinance as yf
-import matplotlib.pyplot as plt
 import os
-import toml
-from send_email import send_email_with_attachment
+from datetime import datetime
+import pytz
+import settings
+from send_email import send_email_with_attachment, recipients, content_id
+from market_data import fetch_market_data
+from indicators import load_state, save_state, sync_series
+from analytics import compute_analytics
+from render import render_report
+from chart_assets import prune_archive
+import tracing
 
 # Load settings from the TOML file
-config = toml.load("settings.toml")
+config = settings.load()
 tickers = config['tickers']['symbols']
 years_back = config['analysis']['years_back']
 y_min = None
+bollinger_window = config['analysis'].get('bollinger_window', 20)
+bollinger_k = config['analysis'].get('bollinger_k', 2.0)
+charts_per_page = config['analysis'].get('charts_per_page', 6)
+render_workers = config['analysis'].get('render_workers')
+decimation = config['analysis'].get('decimation', 'minmax')
+
+# Chart encoding ("png" or "webp") and byte budgets, and how long stock_analysis/ keeps charts
+chart_encoding = {
+    'format': config['analysis'].get('chart_format', 'png'),
+    'page_budget': config['analysis'].get('chart_budget_kb', 400) * 1024,
+    'thumbnail_budget': config['analysis'].get('thumbnail_budget_kb', 12) * 1024,
+}
+archive_days = config['analysis'].get('archive_days', 30)
+archive_max_mb = config['analysis'].get('archive_max_mb', 200)
 
 # Email settings
 sender_email = config['email']['sender_email']
-receiver_email = config['email']['receiver_email']
+receiver_email = recipients(config['email'])  # receiver_email plus any additional_email
 password = config['email']['password']
 
 timezone = pytz.timezone('Australia/Perth')
-current_time = datetime.now(timezone).strftime("%Y%m%d_%H%M%S")
-subject = f"{datetime.now().strftime('%d/%m/%Y')} - Auto Stock Report"
-
-def fetch_dividend_yield(ticker, years_back=5):
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=365 * years_back)
-    end_date = end_date.strftime('%Y-%m-%d')
-    start_date = start_date.strftime('%Y-%m-%d')
-    stock = yf.Ticker(ticker)
-    dividends = stock.dividends
-    prices = stock.history(start=start_date, end=end_date)['Close']
-    dividends = dividends[(dividends.index >= start_date) & (dividends.index <= end_date)]
-    
-    dividend_yields = []
-    for date, dividend in dividends.items():
-        price = prices.loc[prices.index <= date].iloc[-1]
-        yield_value = dividend / price
-        dividend_yields.append(yield_value)
-    
-    if dividend_yields:
-        average_yield = np.mean(dividend_yields) * 100  # Convert to percentage
-    else:
-        average_yield = 0
-    return average_yield
+
+def report_subject():
+    # Worked out per report, since a long-running scheduler sends many
+    return f"{datetime.now().strftime('%d/%m/%Y')} - Auto Stock Report"
 
 def fetch_and_visualize(tickers, years_back=5, y_min=None):
-    nrows, ncols = 2, 3
     email_details = {}
-    plt.figure(figsize=(15, 5 * nrows))
-
-    for i, ticker in enumerate(tickers):
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365 * years_back)
-        data = yf.download(ticker, start=start_date.strftime('%Y-%m-%d'), end=end_date.strftime('%Y-%m-%d'))
-        data['Short_MA'] = data['Close'].rolling(window=50).mean()
-        data['Long_MA'] = data['Close'].rolling(window=200).mean()
-        golden_crosses = ((data['Short_MA'] > data['Long_MA']) & (data['Short_MA'].shift(1) <= data['Long_MA'].shift(1)))
-        death_crosses = ((data['Short_MA'] < data['Long_MA']) & (data['Short_MA'].shift(1) >= data['Long_MA'].shift(1)))
-
-        z = np.polyfit(range(len(data['Close'])), data['Close'], 1)
-        p = np.poly1d(z)
-
-        if len(data['Close']) > 0:
-            start_price = p(0)
-            end_price = p(len(data['Close']) - 1)
-            years = years_back
-            CAGR = ((end_price / start_price) ** (1 / years) - 1) * 100
-        
-        average_dividend_yield = fetch_dividend_yield(ticker, years_back=years_back)
-
-        ax = plt.subplot(nrows, ncols, i + 1)
-        ax.plot(data.index, p(range(len(data['Close']))), "r--", label='Trend Line')
-        ax.plot(data['Close'], label='Close Price', color='blue', alpha=0.6)
-        ax.plot(data['Short_MA'], label='50-day MA', color='black', alpha=0.6)
-        ax.plot(data['Long_MA'], label='200-day MA', color='magenta', alpha=0.6)
-        ax.scatter(data.index[golden_crosses], data['Short_MA'][golden_crosses], color='gold', label='Golden Cross', marker='^', zorder=5)
-        ax.scatter(data.index[death_crosses], data['Short_MA'][death_crosses], color='darkred', label='Death Cross', marker='v', zorder=5)
-        ax.set_title(f'{ticker}\nYoY Growth: {CAGR:.2f}%, Avg Div Yield: {average_dividend_yield:.2f}%')
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Price')
-        ax.legend()
-        if y_min is not None:
-            ax.set_ylim(bottom=y_min)
-
-        today_golden_cross = 'Yes' if golden_crosses.iloc[-1] else 'No'
+
+    # Prices and dividends for every ticker come from one batched fetch
+    market_data = fetch_market_data(tickers, years_back=years_back)
+
+    # Trend, CAGR, moving averages, crosses, yields and bands for every ticker at once
+    with tracing.span('analyze', items=len(tickers)):
+        analytics = compute_analytics(market_data, years_back=years_back,
+                                      bollinger_window=bollinger_window, bollinger_k=bollinger_k)
+    summary = analytics['summary']
+
+    # Running moving average state, so only bars since the last run are processed
+    indicator_state = load_state()
+
+    for ticker in tickers:
+        ticker_state = sync_series(indicator_state, ticker, analytics['close'][ticker].dropna())
+        today_golden_cross = 'Yes' if ticker_state['golden_cross'] else 'No'
         email_details[ticker] = {
-            'closing_price': data['Close'].iloc[-1],
-            'golden_cross_today': today_golden_cross
+            'closing_price': summary.at[ticker, 'closing_price'],
+            'golden_cross_today': today_golden_cross,
+            'bollinger_signal': summary.at[ticker, 'bollinger_signal'],
+            'trailing_dividend_yield': summary.at[ticker, 'trailing_yield']
         }
-        
-    plt.tight_layout()
 
-    save_path = os.path.join("stock_analysis", f"{current_time}.png")
-    os.makedirs("stock_analysis", exist_ok=True)
-    plt.savefig(save_path)
-    return save_path, email_details
+    save_state(indicator_state)
+
+    # Old charts are pruned before today's are added
+    prune_archive("stock_analysis", keep_days=archive_days, max_bytes=archive_max_mb * 1024 * 1024)
 
-def format_email_body(email_details):
+    # Charts are split into pages of charts_per_page and drawn in worker processes,
+    # along with a thumbnail per ticker for the email body
+    current_time = datetime.now(timezone).strftime("%Y%m%d_%H%M%S")
+    with tracing.span('render', items=len(tickers)) as span:
+        save_paths, thumbnails = render_report(analytics, tickers, "stock_analysis", current_time, y_min=y_min,
+                                               per_page=charts_per_page, max_workers=render_workers, decimation=decimation,
+                                               thumbnails=True, encoding=chart_encoding)
+        span['bytes'] = sum(os.path.getsize(path) for path in [*save_paths, *thumbnails.values()])
+    for ticker in tickers:
+        email_details[ticker]['thumbnail'] = thumbnails[ticker]
+    return save_paths, email_details
+
+def report_images(save_paths, email_details):
+    # Every image the body of format_email_body refers to, to send inline
+    return [details['thumbnail'] for details in email_details.values() if details.get('thumbnail')] + list(save_paths)
+
+def format_email_body(email_details, save_paths=()):
     body_content = ""
     for ticker, details in email_details.items():
-        body_content += f"<b>{ticker}</b><br>Closing Price: {details['closing_price']:.2f}<br>Golden Cross Today: {details['golden_cross_today']}<br><br>"
+        if details.get('thumbnail'):
+            body_content += f"<img src=\"cid:{content_id(details['thumbnail'])}\" alt=\"{ticker}\"><br>"
+        body_content += f"<b>{ticker}</b><br>Closing Price: {details['closing_price']:.2f}<br>Golden Cross Today: {details['golden_cross_today']}<br>Bollinger: {details['bollinger_signal']}<br>12M Div Yield: {details['trailing_dividend_yield']:.2f}%<br><br>"
+    for path in save_paths:
+        body_content += f"<img src=\"cid:{content_id(path)}\" alt=\"Stock charts\" style=\"max-width:100%\"><br>"
     return body_content
 
-# Execute functions and send email
-save_path, email_details = fetch_and_visualize(tickers, years_back=years_back, y_min=y_min)
-email_body = format_email_body(email_details)
-send_email_with_attachment(subject, sender_email, receiver_email, password, email_body, attachment_path=save_path)
+def send_report():
+    # Stages are traced to metrics/ and optionally summarised at the bottom of the email
+    with tracing.report_run('stock'):
+        save_paths, email_details = fetch_and_visualize(tickers, years_back=years_back, y_min=y_min)
+        email_body = format_email_body(email_details, save_paths) + tracing.email_footer()
+        return send_email_with_attachment(report_subject(), sender_email, receiver_email, password, email_body,
+                                          inline_images=report_images(save_paths, email_details))
+
+# Execute functions and send email, guarded so render worker processes can import this module safely
+if __name__ == "__main__":
+    send_report()
@@ -1,6 +1,7 @@
-import requests
-from bs4 import BeautifulSoup
+from http_cache import cached_get
+from html_parse import parse
 from track_data import open_json, save_json
+import tracing
 
 def get_newest_chapter_info():
     
@@ -9,12 +10,18 @@ def get_newest_chapter_info():
     # URL of the manga page
     url = 'https://tcbscans.me/mangas/5/one-piece'
     
-    # Send a GET request
-    response = requests.get(url)
+    # Send a GET request, revalidating the cached page at most every 15 minutes
+    response = cached_get(url, ttl=900)
     response.raise_for_status()  # Raise an error if the request failed
+
+    # Page unchanged since the last run, so the saved chapter is still the newest
+    saved_info = open_json(tracking_file)
+    if response.not_modified and saved_info:
+        tracing.found_new(0)
+        return f'<tr><td class="content"><h3>Latest Chapter</h3><a href="{saved_info["url"]}">{saved_info["title"]}</a><br>{saved_info["subtitle"]}</td></tr>'
     
-    # Parse the HTML content
-    soup = BeautifulSoup(response.text, 'html.parser')
+    # Parse only the chapter links out of the HTML content
+    soup = parse('tcbscans', response.content)
     
     # Find all chapter entries using the class 'block'
     chapters = soup.find_all('a', class_='block')
@@ -33,14 +40,14 @@ def get_newest_chapter_info():
             'url': chapter_url
         }
         
-        saved_info = open_json(tracking_file)
-        
         # Compare with saved chapter info
         if saved_info and saved_info['title'] == chapter_title:
             header = '<h3>Latest Chapter</h3>'
+            tracing.found_new(0)
         else:
             header = '<h3>Latest Chapter (New!)</h3>'
             save_json(tracking_file, current_info)
+            tracing.found_new(1)
         
         # Format the result as an HTML string with <tr><td class='content'>
         result = f'<tr><td class="content">{header}<a href="{chapter_url}">{chapter_title}</a><br>{chapter_subtitle}</td></tr>'
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history
+import state_store
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    # A fresh state database and history archive per test
+    monkeypatch.setattr(state_store, 'db_file', str(tmp_path / 'state.db'))
+    monkeypatch.setattr(history, 'history_dir', str(tmp_path / 'history'))
+    return tmp_path
@@ -0,0 +1,26 @@
+import pytest
+import ebay
+
+@pytest.mark.parametrize('text, price', [
+    ("AU $1,299.00", 1299.0),
+    ("$80.00 to $120.00", 80.0),
+    ("AU $120.00 to AU $80.50", 80.5),
+    ("1.299,00 EUR", 1299.0),
+    ("US $12", 12.0),
+    ("$1,000,000.00", 1000000.0),
+    ("Free postage", None),
+    ("", None),
+])
+def test_parse_price(text, price):
+    assert ebay.parse_price(text) == price
+
+def test_preprocess_results_drops_placeholders_and_repeats():
+    results = [
+        {'title': 'Shop on eBay', 'price': '$20.00', 'link': 'https://ebay.com/itm/123456'},
+        {'title': 'RTX 3090', 'price': 'AU $900.00', 'link': 'https://www.ebay.com.au/itm/111?hash=x'},
+        {'title': 'RTX 3090 again', 'price': 'AU $850.00', 'link': 'https://www.ebay.com.au/itm/rtx-3090/111'},
+        {'title': 'No price', 'price': 'See description', 'link': 'https://www.ebay.com.au/itm/222'},
+    ]
+    listings = ebay.preprocess_results(results)
+    assert list(listings) == ['111']
+    assert listings['111']['price_value'] == 900.0
@@ -0,0 +1,64 @@
+import types
+import numpy as np
+import pandas as pd
+import pytest
+import history
+
+@pytest.fixture
+def clock(monkeypatch):
+    # history reads the time through its time module
+    now = [1_700_000_000]
+    monkeypatch.setattr(history, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+def record_days(clock, rng, days=75, series=('a', 'b', 'c')):
+    # Several observations a day for each series, recorded in separate calls like a module does
+    for day in range(days):
+        for hour in (1, 9, 17):
+            clock[0] = 1_700_000_000 + day * 86400 + hour * 3600
+            history.record('test', [(name, float(value)) for name in series
+                                    for value in rng.uniform(10, 20, rng.integers(1, 4))])
+
+def expected_rollup(records, period):
+    frame = pd.DataFrame({'series': records['series'], 't': records['t'], 'value': records['value'].astype(np.float64)})
+    frame['bucket'] = history.buckets(records['t'], period)
+    grouped = frame.groupby(['series', 'bucket'])['value']
+    return grouped.agg(['count', 'mean', 'min', 'max', 'median']).reset_index()
+
+@pytest.mark.parametrize('period', history.periods)
+def test_rollups_match_pandas(state_dir, clock, period):
+    record_days(clock, np.random.default_rng(0))
+    rollup = pd.DataFrame(history.load_rollup('test', period))
+    expected = expected_rollup(np.asarray(history.load_records('test')), period)
+    assert len(rollup) == len(expected)
+    np.testing.assert_array_equal(rollup['series'], expected['series'])
+    np.testing.assert_array_equal(rollup['bucket'], expected['bucket'])
+    np.testing.assert_array_equal(rollup['count'], expected['count'])
+    for stat in ('mean', 'min', 'max', 'median'):
+        np.testing.assert_allclose(rollup[stat], expected[stat], rtol=1e-6)
+
+def test_query_and_window_stat(state_dir, clock):
+    record_days(clock, np.random.default_rng(1), days=40)
+    rows = history.query('test', 'b', days=7, period='daily')
+    assert len(rows) == 8
+    assert (np.diff(rows['bucket']) == 1).all()
+
+    records = np.asarray(history.load_records('test'))
+    series_id = history.load_series_ids('test')['b']
+    recent = records[(records['series'] == series_id) & (records['t'] >= clock[0] - 10 * 86400)]
+    assert history.window_stat('test', 'b', days=10) == pytest.approx(np.median(recent['value'].astype(np.float64)))
+    assert history.window_stat('test', 'missing') is None
+    assert len(history.query('test', 'missing')) == 0
+
+def test_partial_record_is_trimmed(state_dir, clock):
+    history.record('test', [('a', 1.0), ('b', 2.0)])
+    with open(history.source_path('test', 'bin'), 'ab') as file:
+        file.write(b'\x00' * 5)
+    history.record('test', [('a', 3.0), ('c', float('nan'))])
+    records = history.load_records('test')
+    assert len(records) == 3
+    assert list(records['value']) == [1.0, 2.0, 3.0]
+
+@pytest.mark.parametrize('text, count', [("1.2k", 1200.0), ("3M", 3e6), ("1,234", 1234.0), ("Unknown", None)])
+def test_parse_count(text, count):
+    assert history.parse_count(text) == count
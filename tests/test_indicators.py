@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bollinger import bollinger_bands
+from decimate import decimation_indices, minmax_indices
+from price_matrix import pack_rows, rolling_mean, rolling_mean_std, to_matrix, unpack_rows
+
+@pytest.fixture
+def close():
+    # A stock on business days, a coin on every day, and a stock that listed later
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2023-01-01', periods=400, freq='D')
+    frame = pd.DataFrame({ticker: 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+                          for ticker in ['VGS.AX', 'BTC-AUD', 'NEW.AX']}, index=dates)
+    frame.loc[frame.index.dayofweek >= 5, ['VGS.AX', 'NEW.AX']] = np.nan
+    frame.loc[:'2023-06-30', 'NEW.AX'] = np.nan
+    return frame
+
+def test_pack_rows_round_trip(close):
+    matrix = to_matrix(close)
+    packed, order, counts = pack_rows(matrix)
+    np.testing.assert_array_equal(counts, close.notna().sum().to_numpy())
+    np.testing.assert_array_equal(unpack_rows(packed, order, counts), matrix)
+
+@pytest.mark.parametrize('window', [1, 5, 20, 300])
+def test_rolling_matches_pandas(close, window):
+    packed, order, counts = pack_rows(to_matrix(close))
+    mean, std = rolling_mean_std(packed, counts, window)
+    mean_only = rolling_mean(packed, counts, window)
+    for row, ticker in enumerate(close.columns):
+        series = close[ticker].dropna()
+        rolling = series.rolling(window)
+        count = counts[row]
+        np.testing.assert_allclose(mean[row, :count], rolling.mean().to_numpy(), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(mean_only[row, :count], rolling.mean().to_numpy(), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(std[row, :count], rolling.std(ddof=0).to_numpy(), rtol=1e-6, atol=1e-5, equal_nan=True)
+
+def test_bollinger_matches_pandas(close):
+    window, k, lookback = 20, 2.0, 60
+    bands = bollinger_bands(close, window=window, k=k, squeeze_lookback=lookback)
+    for ticker in close.columns:
+        series = close[ticker].dropna()
+        middle = series.rolling(window).mean()
+        std = series.rolling(window).std(ddof=0)
+        upper, lower = middle + k * std, middle - k * std
+        bandwidth = (upper - lower) / middle
+        squeeze = bandwidth <= bandwidth.rolling(lookback, min_periods=lookback).min()
+        for name, expected in [('middle', middle), ('upper', upper), ('lower', lower), ('bandwidth', bandwidth)]:
+            # Days the ticker didn't trade stay empty
+            assert bands[name][ticker].isna().equals(expected.reindex(close.index).isna())
+            np.testing.assert_allclose(bands[name][ticker].dropna(), expected.dropna(), rtol=1e-6)
+        pd.testing.assert_series_equal(bands['squeeze'][ticker][series.index], squeeze, check_names=False)
+        pd.testing.assert_series_equal(bands['touch_upper'][ticker], close[ticker] >= bands['upper'][ticker])
+
+def test_minmax_keeps_every_bucket_extreme():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=1000)
+    values[rng.choice(1000, 50, replace=False)] = np.nan
+    buckets = 37
+    ids = (np.arange(len(values)) * buckets) // len(values)
+    groups = pd.Series(values).groupby(ids)
+    expected = np.union1d(groups.idxmin().to_numpy(), groups.idxmax().to_numpy())
+    np.testing.assert_array_equal(minmax_indices(values, buckets), expected)
+
+def test_decimation_keeps_ends_extremes_and_markers():
+    rng = np.random.default_rng(2)
+    close = np.cumsum(rng.normal(size=5000))
+    average = pd.Series(close).rolling(50).mean().to_numpy()
+    markers = np.zeros(len(close), dtype=bool)
+    markers[[123, 4000]] = True
+    indices = decimation_indices({'close': close, 'average': average}, 200, preserve=[markers], envelope=['close'])
+    assert len(indices) < len(close) / 5
+    assert {0, len(close) - 1, 49, int(np.argmin(close)), int(np.argmax(close)), 123, 4000} <= set(indices)
+    assert (np.diff(indices) > 0).all()
+
+def test_short_series_is_not_decimated():
+    values = np.arange(100, dtype=float)
+    np.testing.assert_array_equal(decimation_indices({'close': values}, 60), np.arange(100))
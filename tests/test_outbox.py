@@ -0,0 +1,72 @@
+import socket
+import pytest
+import send_email
+import smtp_sink
+import state_store
+
+class RejectingHandler(smtp_sink.SMTPHandler):
+    # Refuses every message after its data is sent, like a server rejecting the content
+    def reply(self, line):
+        super().reply("554 5.7.1 Message rejected" if line.startswith("250 OK: queued") else line)
+
+@pytest.fixture
+def sink(state_dir, monkeypatch):
+    sink = smtp_sink.start_sink()
+    monkeypatch.setattr(send_email, 'smtp_host', '127.0.0.1')
+    monkeypatch.setattr(send_email, 'smtp_port', sink.port)
+    monkeypatch.setattr(send_email, 'smtp_starttls', False)
+    yield sink
+    send_email.close_connections()
+    sink.shutdown()
+    sink.server_close()
+
+def closed_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def send(subject):
+    return send_email.send_email_with_attachment(subject, 'bot@localhost', ['me@localhost', 'you@localhost'], 'secret',
+                                                 f"<p>{subject}</p>")
+
+def test_messages_are_sent_on_one_connection(sink):
+    assert send("first")
+    assert send("second")
+    assert len(sink.messages) == 2
+    assert sink.sessions == 1
+    assert sink.messages[0]['to'] == ['<me@localhost>', '<you@localhost>']
+    assert state_store.get_records('outbox') == {}
+
+def test_failed_message_is_retried_later(sink, monkeypatch):
+    monkeypatch.setattr(send_email, 'smtp_port', closed_port())
+    assert not send("queued")
+    [(message_id, attempts, last_error)] = send_email.outbox_status()
+    assert attempts == 1 and 'Connection' in last_error
+    # Not due yet, so a flush leaves it alone even once the server is back
+    monkeypatch.setattr(send_email, 'smtp_port', sink.port)
+    assert send_email.flush_outbox('bot@localhost', 'secret') == []
+
+    item = state_store.get_records('outbox')[message_id]
+    state_store.upsert_records('outbox', {message_id: {**item, 'next_attempt': 0}})
+    assert send_email.flush_outbox('bot@localhost', 'secret') == [message_id]
+    assert b"queued" in sink.messages[0]['data']
+    assert send_email.outbox_status() == []
+
+def test_exhausted_message_is_dead_lettered(sink, monkeypatch):
+    monkeypatch.setattr(send_email, 'max_attempts', 2)
+    monkeypatch.setattr(send_email, 'smtp_port', closed_port())
+    assert not send("unreachable")
+    [(message_id, _, _)] = send_email.outbox_status()
+    item = state_store.get_records('outbox')[message_id]
+    state_store.upsert_records('outbox', {message_id: {**item, 'next_attempt': 0}})
+    assert send_email.flush_outbox('bot@localhost', 'secret') == []
+    assert send_email.outbox_status() == []
+    [(dead_id, attempts, _)] = send_email.outbox_status('outbox_dead')
+    assert (dead_id, attempts) == (message_id, 2)
+
+def test_rejected_message_is_dead_lettered_at_once(sink):
+    sink.RequestHandlerClass = RejectingHandler
+    assert not send("rejected")
+    assert sink.messages and send_email.outbox_status() == []
+    [(_, attempts, last_error)] = send_email.outbox_status('outbox_dead')
+    assert attempts == 1 and '554' in last_error
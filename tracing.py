@@ -0,0 +1,209 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import settings
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is left out there
+    resource = None
+
+# Per-stage timing for report runs. Code marks its stages (fetch, parse, analyze,
+# render, state, send) with span(); inside report_run() each span is recorded against
+# the run and the module it ran for, and when the run ends the spans are appended to
+# metrics/trace.jsonl and summed into a Prometheus textfile, metrics/<report>.prom.
+# Outside a run, span() does nothing
+
+stages = ['fetch', 'parse', 'analyze', 'render', 'state', 'send']
+
+_local = threading.local()
+_lock = threading.Lock()
+
+class DeadlineExceeded(Exception):
+    pass
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def current():
+    return getattr(_local, 'run', None), getattr(_local, 'module', None)
+
+@contextmanager
+def report_run(report):
+    run = {'report': report, 'run_id': f"{report}-{time.time():.0f}", 'started': time.time(), 'spans': []}
+    previous = current()
+    _local.run, _local.module = run, report
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        run['duration'] = time.perf_counter() - start
+        run['peak_rss_mb'] = peak_rss_mb()
+        _local.run, _local.module = previous
+        export(run)
+
+@contextmanager
+def attach(run, module_name, deadline=None):
+    # Record this thread's spans against a run started in another thread
+    previous = current(), getattr(_local, 'deadline', None)
+    _local.run, _local.module = run, module_name
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        (_local.run, _local.module), _local.deadline = previous
+
+def propagate(func):
+    # Wrap func so that pool threads running it record spans for the caller's run and
+    # module, and share its deadline
+    run, module_name = current()
+    deadline = getattr(_local, 'deadline', None)
+
+    def wrapper(*args, **kwargs):
+        with attach(run, module_name, deadline):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def module(name, run, deadline=None):
+    # Attach a module's worker thread to the run that started it. deadline is the
+    # time.monotonic() by which the run stops waiting for the module
+    with attach(run, name, deadline), span('module') as attributes:
+        yield attributes
+
+def found_new(count):
+    # Modules report how many new items (releases, listings, chapters, ...) their run
+    # found, so a job can email only when this run turned something up
+    run, module_name = current()
+    if run is None:
+        return
+    with _lock:
+        new = run.setdefault('new', {})
+        new[module_name] = new.get(module_name, 0) + count
+
+def time_left():
+    # Seconds until this thread's module deadline, or None when it has none
+    deadline = getattr(_local, 'deadline', None)
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline(action):
+    # A module that ran past its timeout has already been reported as timed out, so it
+    # stops before e.g. committing state that would hide its updates from the next run
+    left = time_left()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{current()[1]} ran past its deadline, {action} skipped")
+
+@contextmanager
+def span(stage, **attributes):
+    # Callers can add bytes, items or status to the yielded dict as they learn them
+    run, module_name = current()
+    if run is None:
+        yield attributes
+        return
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes['error'] = type(e).__name__
+        raise
+    finally:
+        record = {'stage': stage, 'module': module_name, 'duration': time.perf_counter() - start,
+                  'peak_rss_mb': peak_rss_mb(), **attributes}
+        with _lock:
+            run['spans'].append(record)
+
+def summarise(run):
+    # Totals per (module, stage), and HTTP status counts per module
+    totals = {}
+    statuses = {}
+    for record in run['spans']:
+        total = totals.setdefault((record['module'], record['stage']), {'seconds': 0.0, 'calls': 0, 'bytes': 0, 'items': 0})
+        total['seconds'] += record['duration']
+        total['calls'] += 1
+        total['bytes'] += record.get('bytes', 0)
+        total['items'] += record.get('items', 0)
+        if 'status' in record:
+            key = (record['module'], str(record['status']))
+            statuses[key] = statuses.get(key, 0) + 1
+    return totals, statuses
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text(run):
+    totals, statuses = summarise(run)
+    report = run['report']
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{label_value(label)}"' for key, label in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    metric('report_run_seconds', "Wall time of the report's last run", [({'report': report}, f"{run['duration']:.6f}")])
+    metric('report_run_timestamp_seconds', "When the report last ran", [({'report': report}, f"{run['started']:.0f}")])
+    if run['peak_rss_mb'] is not None:
+        metric('report_peak_rss_megabytes', "Peak resident memory of the process by the end of the run",
+               [({'report': report}, f"{run['peak_rss_mb']:.1f}")])
+    for field, help_text in [('seconds', "Time spent in each stage of each module"), ('calls', "Spans recorded per stage"),
+                             ('bytes', "Bytes transferred or processed per stage"), ('items', "Items handled per stage")]:
+        metric(f'report_stage_{field}', help_text,
+               [({'report': report, 'module': module_name, 'stage': stage}, round(total[field], 6))
+                for (module_name, stage), total in sorted(totals.items(), key=str)])
+    metric('report_http_responses', "HTTP responses per module and status code",
+           [({'report': report, 'module': module_name, 'status': status}, count)
+            for (module_name, status), count in sorted(statuses.items(), key=str)])
+    return "\n".join(lines) + "\n"
+
+def export(run):
+    config = settings.section('tracing')
+    if not config.get('enabled', True):
+        return
+    try:
+        write_metrics(run, config.get('directory', 'metrics'))
+    except OSError as e:
+        # Metrics are never worth failing a report over
+        print(f"Failed to write metrics: {e}")
+
+def write_metrics(run, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, 'trace.jsonl'), 'a') as file:
+        for record in run['spans']:
+            file.write(json.dumps({'run_id': run['run_id'], 'report': run['report'], **record}, default=str) + "\n")
+        file.write(json.dumps({'run_id': run['run_id'], 'report': run['report'], 'stage': 'run', 'module': None,
+                               'duration': run['duration'], 'peak_rss_mb': run['peak_rss_mb'], 'started': run['started']}) + "\n")
+
+    # Written then renamed, so the node_exporter textfile collector never reads half a file
+    path = os.path.join(directory, f"{run['report']}.prom")
+    with open(path + '.tmp', 'w') as file:
+        file.write(prometheus_text(run))
+    os.replace(path + '.tmp', path)
+
+def email_footer(run=None):
+    # Optional timing table for the bottom of a report email ([tracing] email_footer = true)
+    run = run or current()[0]
+    if run is None or not settings.section('tracing').get('email_footer', False):
+        return ""
+    totals, statuses = summarise(run)
+    modules = sorted({module_name for module_name, _ in totals}, key=str)
+    rows = ""
+    for module_name in modules:
+        cells = "".join(f"<td>{totals[(module_name, stage)]['seconds']:.2f}s</td>" if (module_name, stage) in totals else "<td></td>"
+                        for stage in ['module'] + stages)
+        fetched = totals.get((module_name, 'fetch'), {}).get('bytes', 0)
+        codes = ", ".join(f"{status} x{count}" for (name, status), count in sorted(statuses.items()) if name == module_name)
+        rows += f"<tr><td>{module_name}</td>{cells}<td>{fetched / 1024:.0f} KB</td><td>{codes}</td></tr>"
+    header = "".join(f"<th>{stage}</th>" for stage in ['module', 'total'] + stages + ['fetched', 'HTTP'])
+    elapsed = time.time() - run['started']
+    return f"<table style='font-size:11px'><tr>{header}</tr>{rows}</table>Run time so far {elapsed:.1f}s"
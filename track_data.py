@@ -1,12 +1,46 @@
 import json
+import os
+import time
+import state_store
 
-def open_json(file_name):
+# Tracking state lives in the SQLite state store. The JSON files previous versions
+# wrote are imported the first time each one is opened
+
+def read_legacy_json(file_name):
     try:
         with open(file_name, 'r') as file:
             return json.load(file)
-    except FileNotFoundError:
-        return {}
-    
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def open_json(file_name):
+    data = state_store.get_value('documents', file_name)
+    if data is None:
+        data = read_legacy_json(file_name)
+        if data is None:
+            return {}
+        state_store.set_value('documents', file_name, data)
+    return data
+
 def save_json(file_name, file_data):
-    with open(file_name, 'w') as file:
-        json.dump(file_data, file)
\ No newline at end of file
+    state_store.set_value('documents', file_name, file_data)
+
+def migrate_records(collection, legacy_file, legacy_key=None):
+    # Import a module's legacy JSON file into its record collection once. A dict is
+    # imported as-is and a list is keyed by each item's legacy_key field. The import is
+    # marked done in kv, so a collection emptied later is never refilled from the stale file
+    if state_store.get_value('migrations', collection):
+        return
+    # Collections imported before the marker existed already hold their records
+    if not state_store.count_records(collection) and os.path.exists(legacy_file):
+        legacy = read_legacy_json(legacy_file)
+        if isinstance(legacy, list):
+            legacy = {item[legacy_key]: item for item in legacy}
+        if legacy:
+            state_store.upsert_records(collection, legacy)
+    state_store.set_value('migrations', collection, {'file': legacy_file, 'migrated_at': time.time()})
+
+def open_records(collection, legacy_file=None, legacy_key=None):
+    if legacy_file:
+        migrate_records(collection, legacy_file, legacy_key)
+    return state_store.get_records(collection)